@@ -0,0 +1,406 @@
+#!/usr/local/bin/python3
+
+
+# ****** # # # # # # # # # # # # # # # # # # # # # # # ****** #
+# ******                                               ****** #
+# ******   Name: Siddhant Shah                         ****** #
+# ******   Date: 02/05/2023                            ****** #
+# ******   Desc: Tiktok SCRAPER BENCHMARK              ****** #
+# ******   Email: siddhant.shah.1986@gmail.com         ****** #
+# ******                                               ****** #
+# ****** # # # # # # # # # # # # # # # # # # # # # # # ****** #
+
+
+# >> imports
+import os, json, logging, datetime, time, random, argparse, importlib, platform, tempfile, shutil, subprocess, sys
+import numpy, cv2
+
+
+# >> sizes of candidate lists benchmarked by default
+DEFAULT_SIZES = [10, 100, 10000]
+
+# >> syllables used to build synthetic names and bios
+SYLLABLES = ["ka", "li", "mo", "ra", "te", "su", "na", "vi", "do", "pe", "zo", "ha", "ri", "lu", "me", "xo"]
+
+
+# >> function to point module globals of a scraper script to benchmark folder
+def setup_module(module_name: str, work_folder: str) -> "module":
+    """function to import a scraper script and set globals that are normally set in its __main__ block
+
+    Args:
+        module_name (str): scraper or scraper_threading
+        work_folder (str): folder where synthetic avatars and feature cache are kept
+
+    Returns:
+        module: imported scraper script
+    """
+
+    module = importlib.import_module(module_name)
+    base_folder = os.path.dirname(os.path.abspath(__file__))
+
+    with open(os.path.join(base_folder, "config.json"), 'r') as r:
+        config = json.load(r)
+    config["debug"] = False
+
+    logger = logging.getLogger(f"benchmark.{module_name}")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    module.BASE_FOLDER = base_folder
+    module.OUTPUT_FOLDER = work_folder
+    module.AVATAR_FOLDER = os.path.join(work_folder, "avatar")
+    module.CONFIG = config
+    module.logger = logger
+    return module
+
+
+# >> function to generate synthetic avatars
+def generate_avatar_corpus(avatar_folder: str, count: int, seed: int=0) -> list:
+    """function to generate synthetic avatars. Every 10th avatar is a noisy copy of first avatar, so that corpus has near duplicates like real impostors
+
+    Args:
+        avatar_folder (str): folder where avatars are saved
+        count (int): number of avatars
+        seed (int, optional): seed of random generator. Defaults to 0.
+
+    Returns:
+        list: file names of the avatars, first one is avatar of main profile
+    """
+
+    if not os.path.exists(avatar_folder):
+        os.makedirs(avatar_folder)
+
+    generator = numpy.random.default_rng(seed)
+    main_image = None
+    avatar_files = []
+    for i in range(count):
+        if main_image is not None and i % 10 == 0:
+            noise = generator.integers(-12, 12, main_image.shape)
+            image = numpy.clip(main_image.astype(numpy.int16) + noise, 0, 255).astype(numpy.uint8)
+        else:
+            image = cv2.resize(generator.integers(0, 256, (8, 8, 3), dtype=numpy.uint8), (96, 96), interpolation=cv2.INTER_CUBIC)
+            center = tuple(int(value) for value in generator.integers(20, 76, 2))
+            color = tuple(int(value) for value in generator.integers(0, 256, 3))
+            cv2.circle(image, center, int(generator.integers(8, 30)), color, -1)
+            if main_image is None:
+                main_image = image
+
+        avatar_file = f"synthetic_{i}.jpeg"
+        cv2.imwrite(os.path.join(avatar_folder, avatar_file), image)
+        avatar_files.append(avatar_file)
+
+    return avatar_files
+
+
+# >> function to generate a synthetic name or bio
+def generate_text(generator: random.Random, words: int) -> str:
+    """function to generate a synthetic name or bio
+
+    Args:
+        generator (random.Random): random generator
+        words (int): number of words
+
+    Returns:
+        str: synthetic text
+    """
+
+    return " ".join("".join(generator.choice(SYLLABLES) for _ in range(generator.randint(2, 4))).capitalize() for _ in range(words))
+
+
+# >> function to generate synthetic profile dicts
+def generate_profiles(count: int, avatar_folder: str, avatar_files: list, seed: int=0) -> tuple:
+    """function to generate synthetic main profile and its matching profiles, in the shape both scripts use.
+        Some matching profiles reuse username of an earlier one, so that sanitize_matching_profiles has duplicates to drop.
+
+    Args:
+        count (int): number of matching profiles
+        avatar_folder (str): folder of the avatars
+        avatar_files (list): file names of the avatars, first one is avatar of main profile
+        seed (int, optional): seed of random generator. Defaults to 0.
+
+    Returns:
+        tuple: main profile and list of matching profiles
+    """
+
+    generator = random.Random(seed)
+
+    def profile(username, avatar_file):
+        return {
+            "username": username,
+            "fullname": generate_text(generator, 2),
+            "bio": generate_text(generator, generator.randint(0, 12)),
+            "follower_count": generator.randint(0, 1000000),
+            "avatar_url": f"https://example.com/{avatar_file}",
+            "avatar": os.path.join(avatar_folder, avatar_file),
+            "avatar_file": avatar_file,
+            "avatar_hash": ""
+        }
+
+    main_profile = profile("main_profile", avatar_files[0])
+    matching_profiles = []
+    for i in range(count):
+        username = f"candidate_{generator.randrange(i)}" if i and i % 20 == 0 else f"candidate_{i}"
+        matching_profile = profile(username, avatar_files[1 + i % (len(avatar_files) - 1)])
+
+        # impostors copy name of main profile
+        if i % 10 == 0:
+            matching_profile["fullname"] = main_profile["fullname"]
+        matching_profiles.append(matching_profile)
+
+    return main_profile, matching_profiles
+
+
+# >> function to time a function over a list of arguments
+def measure(function, calls: list, warmup: int=3) -> dict:
+    """function to time a function over a list of arguments
+
+    Args:
+        function (callable): function to be timed
+        calls (list): tuple of positional arguments for every call
+        warmup (int, optional): calls made before timing starts. Defaults to 3.
+
+    Returns:
+        dict: ops per second and latency percentiles in microseconds
+    """
+
+    for args in calls[:warmup]:
+        function(*args)
+
+    timings = []
+    for args in calls:
+        started = time.perf_counter_ns()
+        function(*args)
+        timings.append(time.perf_counter_ns() - started)
+
+    return get_stats(timings)
+
+
+# >> function to get ops per second and latency percentiles of timings
+def get_stats(timings: list) -> dict:
+    """function to get ops per second and latency percentiles of timings
+
+    Args:
+        timings (list): duration of every call in nanoseconds
+
+    Returns:
+        dict: ops per second and latency percentiles in microseconds
+    """
+
+    timings = numpy.array(timings, dtype=numpy.float64) / 1000
+    return {
+        "calls": len(timings),
+        "ops_per_sec": round(len(timings) / (timings.sum() / 1000000), 2) if timings.sum() else None,
+        "mean_us": round(float(timings.mean()), 2),
+        "p50_us": round(float(numpy.percentile(timings, 50)), 2),
+        "p90_us": round(float(numpy.percentile(timings, 90)), 2),
+        "p99_us": round(float(numpy.percentile(timings, 99)), 2)
+    }
+
+
+# >> function to time start of a script in a fresh interpreter
+def measure_startup(script: str, runs: int, first_prompt: bool=False) -> dict:
+    """function to time start of a script in a fresh interpreter, the way an operator starts it
+
+    Args:
+        script (str): scraper or scraper_threading
+        runs (int): number of fresh interpreters started
+        first_prompt (bool, optional): also print the banner shown before first prompt. Defaults to False.
+
+    Returns:
+        dict: stats of start time, and heavy modules loaded by importing the script
+    """
+
+    code = f"import {script}" + (f"; {script}.intro()" if first_prompt else "")
+    base_folder = os.path.dirname(os.path.abspath(__file__))
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter_ns()
+        subprocess.run([sys.executable, "-c", code], cwd=base_folder, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter_ns() - started)
+
+    # heavy modules that should only be loaded by the stage that needs them
+    heavy_modules = ["numpy", "cv2", "pandas", "PIL", "fuzzywuzzy", "rapidfuzz", "aiohttp", "requests", "pyfiglet"]
+    check = f"import sys, json, {script}; print(json.dumps([ name for name in {heavy_modules!r} if name in sys.modules ]))"
+    loaded = json.loads(subprocess.run([sys.executable, "-c", check], cwd=base_folder, capture_output=True, text=True, check=True).stdout)
+
+    stats = get_stats(timings)
+    stats["heavy_modules_loaded"] = loaded
+    return stats
+
+
+# >> function to clear in memory and on disk feature cache
+def clear_feature_cache(module) -> None:
+    """function to clear in memory and on disk feature cache, so that next avatar comparison has to decode images
+
+    Args:
+        module (module): scraper script
+    """
+
+    module.AVATAR_FEATURES.clear()
+    module.AVATAR_FILE_HASHES.clear()
+    shutil.rmtree(os.path.join(module.OUTPUT_FOLDER, "features"), ignore_errors=True)
+
+
+# >> function to run all benchmarks of a scraper script at one size
+def run_benchmarks(module, size: int, samples: int, repeat: int, corpus_limit: int) -> dict:
+    """function to run all benchmarks of a scraper script at one size
+
+    Args:
+        module (module): scraper script, set up by setup_module
+        size (int): number of matching profiles
+        samples (int): max calls timed for functions that compare a single pair
+        repeat (int): calls timed for functions that work on whole list
+        corpus_limit (int): max number of distinct avatars generated
+
+    Returns:
+        dict: stats of each benchmark, keyed by name of function
+    """
+
+    avatar_folder = module.AVATAR_FOLDER
+    shutil.rmtree(avatar_folder, ignore_errors=True)
+    clear_feature_cache(module)
+
+    avatar_files = generate_avatar_corpus(avatar_folder, min(size, corpus_limit) + 1)
+    main_profile, matching_profiles = generate_profiles(size, avatar_folder, avatar_files)
+    pairs = matching_profiles[:samples]
+    threading_script = module.__name__ == "scraper_threading"
+
+    # scraper reads avatars from complete path, scraper_threading from file name in avatar folder
+    avatar_key = "avatar_file" if threading_script else "avatar"
+    avatar_calls = [ (main_profile[avatar_key], matching_profile[avatar_key]) for matching_profile in pairs ]
+
+    results = {}
+    clear_feature_cache(module)
+    results["compare_avatar (cold)"] = measure(module.compare_avatar, avatar_calls, warmup=0)
+    results["compare_avatar (warm)"] = measure(module.compare_avatar, avatar_calls)
+    results["compare_avatar_old"] = measure(module.compare_avatar_old, [ (main_profile["avatar"], matching_profile["avatar"]) for matching_profile in pairs ])
+    results["compare_string"] = measure(module.compare_string, [ (main_profile["fullname"], matching_profile["fullname"]) for matching_profile in pairs ])
+
+    if threading_script:
+        results["compare_profiles"] = measure(module.compare_profiles, [ (main_profile, dict(matching_profile)) for matching_profile in pairs ])
+    else:
+        results["compare_profiles"] = measure(module.compare_profiles, [ (dict(matching_profile), main_profile) for matching_profile in pairs ])
+
+    results["sanitize_matching_profiles"] = measure(module.sanitize_matching_profiles, [ (matching_profiles, main_profile["username"]) ] * repeat)
+
+    # scores are made up so that selection alone is timed
+    generator = random.Random(size)
+    for matching_profile in matching_profiles:
+        matching_profile["avatar_similarity"] = generator.uniform(0, 100000)
+        matching_profile["name_similarity"] = generator.randint(0, 100)
+        matching_profile["bio_similarity"] = generator.randint(0, 100)
+        matching_profile["comparison_score"] = generator.choice([0, 10, 30, 40, 60, 70, 90, 100])
+    results["get_closest_matching_profile"] = measure(module.get_closest_matching_profile, [ (matching_profiles,) ] * repeat)
+
+    for stats in results.values():
+        stats["size"] = size
+    return results
+
+
+# >> function to compare results with results of a previous run
+def compare_results(current: dict, previous: dict, threshold: float) -> list:
+    """function to compare ops per second of every benchmark with a previous run
+
+    Args:
+        current (dict): results of this run
+        previous (dict): results of previous run
+        threshold (float): drop in ops per second, in percent, reported as regression
+
+    Returns:
+        list: names of benchmarks that regressed
+    """
+
+    regressions = []
+    print(f"\n {'Benchmark':<50} {'Before ops/s':>14} {'After ops/s':>14} {'Change':>9}")
+    for name, stats in current["results"].items():
+        before = previous["results"].get(name, {}).get("ops_per_sec")
+        after = stats["ops_per_sec"]
+        if not before or not after:
+            continue
+
+        change = (after - before) / before * 100
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  << REGRESSION"
+        print(f" {name:<50} {before:>14.2f} {after:>14.2f} {change:>8.1f}%{flag}")
+
+    return regressions
+
+
+# >> function to print results as table
+def print_results(results: dict) -> None:
+    """function to print results as table
+
+    Args:
+        results (dict): stats of each benchmark, keyed by name of benchmark
+    """
+
+    print(f"\n {'Benchmark':<50} {'Calls':>7} {'ops/s':>12} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10}")
+    for name, stats in results.items():
+        print(f" {name:<50} {stats['calls']:>7} {stats['ops_per_sec'] or 0:>12.2f} {stats['p50_us']:>10.2f} {stats['p90_us']:>10.2f} {stats['p99_us']:>10.2f}")
+
+
+# >> function where benchmarks are run
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the scoring hot path on synthetic avatars and profiles")
+    parser.add_argument("--script", choices=["scraper_threading", "scraper"], default="scraper_threading", help="script to benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="number of matching profiles")
+    parser.add_argument("--samples", type=int, default=200, help="max calls timed for functions that compare a single pair")
+    parser.add_argument("--repeat", type=int, default=20, help="calls timed for functions that work on whole list")
+    parser.add_argument("--corpus-limit", type=int, default=1000, help="max number of distinct avatars generated")
+    parser.add_argument("--output", help="JSON file where results are saved. Defaults to BENCHMARKs/<script>-<time>.json")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0, help="drop in ops/sec, in percent, reported as regression")
+    parser.add_argument("--suite", choices=["all", "hot-path", "startup"], default="all", help="benchmarks to run")
+    parser.add_argument("--startup-runs", type=int, default=10, help="fresh interpreters started to time startup")
+    args = parser.parse_args()
+
+    results = {}
+    if args.suite in ("all", "startup"):
+        print(f"\n [+] Timing startup of {args.script}")
+        results["startup (import)"] = measure_startup(args.script, args.startup_runs)
+        results["startup (first prompt)"] = measure_startup(args.script, args.startup_runs, first_prompt=True)
+        if results["startup (import)"]["heavy_modules_loaded"]:
+            print(f"    [!!] Heavy modules loaded at import: {', '.join(results['startup (import)']['heavy_modules_loaded'])}")
+
+    if args.suite in ("all", "hot-path"):
+        work_folder = tempfile.mkdtemp(prefix="tiktok-benchmark-")
+        try:
+            module = setup_module(args.script, work_folder)
+            for size in args.sizes:
+                print(f"\n [+] Benchmarking {args.script} with {size} matching profiles")
+                results.update({ f"{name} [{size}]": stats for name, stats in run_benchmarks(module, size, args.samples, args.repeat, args.corpus_limit).items() })
+        finally:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "script": args.script,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+
+    output_file = args.output
+    if not output_file:
+        output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BENCHMARKs")
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        output_file = os.path.join(output_folder, f"{args.script}-{datetime.datetime.now().strftime('%d-%m-%Y %H-%M-%S')}.json")
+    with open(output_file, 'w') as w:
+        json.dump(report, w, indent=4)
+    print(f"\n [+] Results saved to {output_file}")
+
+    if args.compare:
+        with open(args.compare, 'r') as r:
+            regressions = compare_results(report, json.load(r), args.threshold)
+        if regressions:
+            print(f"\n [xx] {len(regressions)} benchmarks regressed by more than {args.threshold}%")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+#!/usr/local/bin/python3
+
+
+# ****** # # # # # # # # # # # # # # # # # # # # # # # ****** #
+# ******                                               ****** #
+# ******   Name: Siddhant Shah                         ****** #
+# ******   Date: 02/05/2023                            ****** #
+# ******   Desc: Tiktok SCRAPER LOAD TEST              ****** #
+# ******   Email: siddhant.shah.1986@gmail.com         ****** #
+# ******                                               ****** #
+# ****** # # # # # # # # # # # # # # # # # # # # # # # ****** #
+
+
+# >> imports
+import os, sys, json, logging, datetime, time, random, argparse, importlib, tempfile, shutil, threading, hashlib, multiprocessing, functools
+import urllib.parse, http.server
+import numpy, cv2
+
+
+# >> syllables used to build synthetic names and bios
+SYLLABLES = ["ka", "li", "mo", "ra", "te", "su", "na", "vi", "do", "pe", "zo", "ha", "ri", "lu", "me", "xo"]
+
+
+# >> local stand-in for RapidAPI and avatar CDN
+class StubServer:
+    """local http server that answers user/info and user/search in the shape RapidAPI does and serves synthetic avatars.
+        Latency, server errors and 429 responses can be injected to see how the scripts behave under a slow or throttling api.
+    """
+
+    def __init__(self, port: int=0, candidates: int=30, avatar_pool: int=500, latency: float=0.0, jitter: float=0.0, error_rate: float=0.0, throttle_rate: float=0.0, retry_after: int=1, seed: int=0):
+        """
+        Args:
+            port (int, optional): port to listen on, 0 picks a free port. Defaults to 0.
+            candidates (int, optional): profiles returned by every search. Defaults to 30.
+            avatar_pool (int, optional): distinct avatars served, profiles share avatars of the pool. Defaults to 500.
+            latency (float, optional): seconds added to every response. Defaults to 0.0.
+            jitter (float, optional): max random seconds added on top of latency. Defaults to 0.0.
+            error_rate (float, optional): share of requests answered with 500. Defaults to 0.0.
+            throttle_rate (float, optional): share of requests answered with 429. Defaults to 0.0.
+            retry_after (int, optional): Retry-After header sent with 429. Defaults to 1.
+            seed (int, optional): seed of random generators. Defaults to 0.
+        """
+
+        self.candidates = candidates
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.avatars = self.generate_avatars(avatar_pool, seed)
+
+        stub = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    @staticmethod
+    def generate_avatars(count: int, seed: int) -> list:
+        """function to encode synthetic avatars as jpeg
+
+        Args:
+            count (int): number of avatars
+            seed (int): seed of random generator
+
+        Returns:
+            list: jpeg bytes of every avatar
+        """
+
+        generator = numpy.random.default_rng(seed)
+        avatars = []
+        for _ in range(count):
+            image = cv2.resize(generator.integers(0, 256, (8, 8, 3), dtype=numpy.uint8), (96, 96), interpolation=cv2.INTER_CUBIC)
+            center = tuple(int(value) for value in generator.integers(20, 76, 2))
+            cv2.circle(image, center, int(generator.integers(8, 30)), tuple(int(value) for value in generator.integers(0, 256, 3)), -1)
+            avatars.append(cv2.imencode(".jpeg", image)[1].tobytes())
+        return avatars
+
+    def start(self) -> None:
+        """function to start serving in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """function to stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name: str) -> None:
+        """function to count a response
+
+        Args:
+            name (str): kind of response
+        """
+
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def get_user(self, username: str) -> dict:
+        """function to build user the way RapidAPI returns it. Same username always gives same user
+
+        Args:
+            username (str): username of the profile
+
+        Returns:
+            dict: user with stats
+        """
+
+        generator = random.Random(username)
+        stats = { "followerCount": generator.randint(0, 1000000), "followingCount": generator.randint(0, 1000), "videoCount": generator.randint(0, 500) }
+        return {
+            "user": {
+                "uniqueId": username,
+                "nickname": " ".join("".join(generator.choice(SYLLABLES) for _ in range(generator.randint(2, 4))).capitalize() for _ in range(2)),
+                "signature": " ".join(generator.choice(SYLLABLES) * 2 for _ in range(generator.randint(0, 12))),
+                "avatarMedium": f"{self.url}/avatar/{generator.randrange(len(self.avatars))}.jpeg",
+                # scraper reads stats from inside user, scraper_threading next to it
+                "stats": stats
+            },
+            "stats": stats
+        }
+
+    def handle(self, request: http.server.BaseHTTPRequestHandler) -> None:
+        """function to answer a request
+
+        Args:
+            request (http.server.BaseHTTPRequestHandler): request to be answered
+        """
+
+        url = urllib.parse.urlparse(request.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.count("429")
+            return self.send(request, 429, b'{"message": "Too many requests"}', headers={ "Retry-After": str(self.retry_after) })
+        if roll < self.throttle_rate + self.error_rate:
+            self.count("500")
+            return self.send(request, 500, b'{"message": "Internal server error"}')
+
+        if url.path == "/user/info":
+            self.count("user/info")
+            data = self.get_user(query.get("unique_id", "").lstrip("@"))
+            body = { "code": 0, "msg": "success", "processed_time": round(delay, 4), "data": data }
+        elif url.path == "/user/search":
+            self.count("user/search")
+            keyword = query.get("keywords", "")
+            seed = int(hashlib.sha1(keyword.encode("utf-8")).hexdigest()[:8], 16)
+            user_list = [ self.get_user(f"user_{(seed + i) % 10000000}") for i in range(self.candidates) ]
+            body = { "code": 0, "msg": "success", "processed_time": round(delay, 4), "data": { "user_list": user_list, "cursor": self.candidates, "hasMore": False } }
+        elif url.path.startswith("/avatar/"):
+            self.count("avatar")
+            try:
+                avatar = self.avatars[int(url.path.split("/")[-1].split(".")[0])]
+            except (ValueError, IndexError):
+                return self.send(request, 404, b"")
+            return self.send(request, 200, avatar, content_type="image/jpeg")
+        else:
+            return self.send(request, 404, b"")
+
+        self.send(request, 200, json.dumps(body).encode("utf-8"), headers={ "X-RateLimit-Requests-Limit": "100000000", "X-RateLimit-Requests-Remaining": "100000000" })
+
+    @staticmethod
+    def send(request: http.server.BaseHTTPRequestHandler, status: int, body: bytes, content_type: str="application/json", headers: dict=None) -> None:
+        """function to write a response
+
+        Args:
+            request (http.server.BaseHTTPRequestHandler): request to be answered
+            status (int): status code
+            body (bytes): body of response
+            content_type (str, optional): content type of body. Defaults to "application/json".
+            headers (dict, optional): extra headers. Defaults to None.
+        """
+
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+
+# >> function to wrap a module function so that time spent in it is added to a phase
+def time_phase(module, function_name: str, phase: str, timings: dict) -> None:
+    """function to wrap a module function so that time spent in it is added to a phase. Used for scraper, which has no stage timings of its own
+
+    Args:
+        module (module): scraper script
+        function_name (str): name of function in module
+        phase (str): name of the phase
+        timings (dict): seconds spent in each phase
+    """
+
+    function = getattr(module, function_name)
+    timings.setdefault(phase, 0.0)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[phase] += time.perf_counter() - started
+
+    setattr(module, function_name, wrapper)
+
+
+# >> function to get peak memory of load test process and of its worker processes
+def get_peak_rss() -> tuple:
+    """function to get peak resident memory of this process and of its finished child processes.
+        resource module is only on unix, psutil is used on windows when installed and children are not reported there.
+
+    Returns:
+        tuple: peak memory of process and of its workers in MB, None where it can not be measured
+    """
+
+    try:
+        import resource
+
+        # ru_maxrss is in bytes on mac and in kilobytes on linux
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return (
+            round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+        )
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+
+        memory = psutil.Process().memory_info()
+        return (round(getattr(memory, "peak_wset", memory.rss) / (1024 * 1024), 1), None)
+    except ImportError:
+        print(" [!!] peak memory is not measured, install psutil to measure it on this platform")
+        return (None, None)
+
+
+# >> function to run one script against stub server, runs in its own process so that peak memory belongs to this run only
+def run_script(script: str, stub_url: str, profiles: int, overrides: dict, results: "multiprocessing.Queue") -> None:
+    """function to run main of one script against stub server and report throughput, peak memory and time spent in each phase
+
+    Args:
+        script (str): scraper or scraper_threading
+        stub_url (str): base url of stub server
+        profiles (int): number of main profiles
+        overrides (dict): config values replaced for this run
+        results (multiprocessing.Queue): queue where report is put
+    """
+
+    base_folder = tempfile.mkdtemp(prefix="tiktok-load-test-")
+    try:
+        module = importlib.import_module(script)
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"), 'r') as r:
+            config = json.load(r)
+
+        main_profiles = [ f"main_{i}" for i in range(profiles) ]
+        config["debug"] = False
+        config["save_json"] = False
+        config["rapid_api"]["host"] = urllib.parse.urlparse(stub_url).netloc
+        config["rapid_api"]["user_info_url"] = f"{stub_url}/user/info"
+        config["rapid_api"]["search_profiles_url"] = f"{stub_url}/user/search"
+        config["account"] = main_profiles
+        for section, values in overrides.items():
+            if isinstance(values, dict):
+                config.setdefault(section, {}).update(values)
+            else:
+                config[section] = values
+
+        with open(os.path.join(base_folder, config["input_file"]), 'w') as w:
+            w.write("\n".join(f"https://www.tiktok.com/@{main_profile}" for main_profile in main_profiles))
+
+        logger = logging.getLogger(f"load_test.{script}")
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+
+        module.BASE_FOLDER = base_folder
+        module.OUTPUT_FOLDER = os.path.join(base_folder, "DATA")
+        module.AVATAR_FOLDER = os.path.join(module.OUTPUT_FOLDER, "avatar")
+        module.OUTPUT_CSV_FILE = module.CSV_FILE = "load_test.csv"
+        module.CONFIG = config
+        module.logger = logger
+        os.makedirs(module.AVATAR_FOLDER)
+
+        phase_timings = {}
+        if script == "scraper":
+            time_phase(module, "make_request", "api", phase_timings)
+            time_phase(module, "get_profile_avatar", "download", phase_timings)
+            time_phase(module, "compare_avatars_batch", "score", phase_timings)
+            time_phase(module, "compare_profiles", "score", phase_timings)
+            time_phase(module, "get_top_matching_profiles", "select", phase_timings)
+
+        started = time.perf_counter()
+        module.main()
+        elapsed = time.perf_counter() - started
+
+        metrics = None
+        if script == "scraper_threading":
+            phase_timings = dict(module.STAGE_TIMINGS)
+            metrics = module.METRICS.snapshot()
+            if module.SCORE_EXECUTOR:
+                module.SCORE_EXECUTOR.shutdown()
+            for name in ("HTTP_ENGINE", "RESPONSE_CACHE", "DELTA_STORE", "WORK_QUEUE"):
+                if getattr(module, name, None):
+                    getattr(module, name).close()
+
+        rows = 0
+        output_file = os.path.join(module.OUTPUT_FOLDER, "CSVs", "load_test.csv")
+        if os.path.exists(output_file):
+            with open(output_file, 'r', encoding='utf-8', errors='ignore') as r:
+                rows = max(sum(1 for _ in r) - 1, 0)
+
+        peak_rss_mb, peak_rss_workers_mb = get_peak_rss()
+        results.put({
+            "script": script,
+            "profiles": profiles,
+            "seconds": round(elapsed, 3),
+            "profiles_per_sec": round(profiles / elapsed, 2) if elapsed else None,
+            "rows": rows,
+            "peak_rss_mb": peak_rss_mb,
+            "peak_rss_workers_mb": peak_rss_workers_mb,
+            "phases": { name: round(seconds, 3) for name, seconds in phase_timings.items() },
+            "metrics": metrics
+        })
+    except Exception as e:
+        results.put({ "script": script, "profiles": profiles, "error": str(e) })
+    finally:
+        shutil.rmtree(base_folder, ignore_errors=True)
+
+
+# >> function to print reports as table
+def print_reports(reports: list) -> None:
+    """function to print reports as table
+
+    Args:
+        reports (list): report of every run
+    """
+
+    print(f"\n {'Script':<20} {'Profiles':>9} {'Seconds':>10} {'Profiles/s':>11} {'Rows':>8} {'RSS MB':>8} {'Workers MB':>11}  Phases")
+    for report in reports:
+        if "error" in report:
+            print(f" {report['script']:<20} {report['profiles']:>9}  failed: {report['error']}")
+            continue
+        phases = " || ".join(f"{name}: {seconds:.2f}s" for name, seconds in report["phases"].items())
+        peak_rss, peak_rss_workers = [ "n/a" if report[key] is None else f"{report[key]:.1f}" for key in ("peak_rss_mb", "peak_rss_workers_mb") ]
+        print(f" {report['script']:<20} {report['profiles']:>9} {report['seconds']:>10.2f} {report['profiles_per_sec'] or 0:>11.2f} {report['rows']:>8} {peak_rss:>8} {peak_rss_workers:>11}  {phases}")
+
+
+# >> function where load test is run
+def main():
+    parser = argparse.ArgumentParser(description="Runs scraper scripts end to end against a local stub of RapidAPI and avatar CDN")
+    parser.add_argument("--scripts", nargs="+", choices=["scraper", "scraper_threading"], default=["scraper", "scraper_threading"], help="scripts to run")
+    parser.add_argument("--profiles", type=int, nargs="+", default=[100, 1000], help="number of main profiles, e.g. 100 1000 10000 100000")
+    parser.add_argument("--candidates", type=int, default=30, help="profiles returned by every search")
+    parser.add_argument("--avatar-pool", type=int, default=500, help="distinct avatars served by stub")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="max random seconds added on top of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After header sent with 429")
+    parser.add_argument("--requests-per-second", type=float, default=1000, help="rate limit of scraper_threading, stub does not need the real one")
+    parser.add_argument("--config", help="JSON file with config values to replace for every run, e.g. {\"pipeline\": {\"fetch_workers\": 16}}")
+    parser.add_argument("--output", help="JSON file where reports are saved. Defaults to LOAD_TESTs/<time>.json")
+    args = parser.parse_args()
+
+    overrides = {
+        "rate_limit": { "requests_per_second": args.requests_per_second, "burst": max(int(args.requests_per_second), 1) },
+        # every response must come from stub, not from cache or state of a previous run
+        "response_cache": { "enabled": False },
+        "delta_scan": { "enabled": False },
+        "journal": { "enabled": False },
+        "work_queue": { "enabled": False },
+        "output": { "format": "csv" }
+    }
+    if args.config:
+        with open(args.config, 'r') as r:
+            for section, values in json.load(r).items():
+                if isinstance(values, dict) and isinstance(overrides.get(section), dict):
+                    overrides[section].update(values)
+                else:
+                    overrides[section] = values
+
+    stub = StubServer(candidates=args.candidates, avatar_pool=args.avatar_pool, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    stub.start()
+    print(f"\n [+] Stub server listening on {stub.url}")
+
+    reports = []
+    context = multiprocessing.get_context("spawn")
+    try:
+        for profiles in args.profiles:
+            for script in args.scripts:
+                print(f"\n [+] Running {script} with {profiles} main profiles")
+                results = context.Queue()
+                process = context.Process(target=run_script, args=(script, stub.url, profiles, overrides, results))
+                process.start()
+                report = results.get()
+                process.join()
+                reports.append(report)
+                print_reports([report])
+    finally:
+        stub.stop()
+
+    print_reports(reports)
+    print(f"\n [+] Stub responses: " + " || ".join(f"{name}: {count}" for name, count in sorted(stub.counts.items())))
+
+    output_file = args.output
+    if not output_file:
+        output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LOAD_TESTs")
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        output_file = os.path.join(output_folder, f"{datetime.datetime.now().strftime('%d-%m-%Y %H-%M-%S')}.json")
+
+    stub_settings = { key: getattr(args, key) for key in ("candidates", "avatar_pool", "latency", "jitter", "error_rate", "throttle_rate", "retry_after") }
+    with open(output_file, 'w') as w:
+        json.dump({ "created": datetime.datetime.now().isoformat(timespec="seconds"), "stub": stub_settings, "overrides": overrides, "reports": reports }, w, indent=4)
+    print(f"\n [+] Reports saved to {output_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,15 +12,13 @@
 
 
 # >> imports
-import requests, os, json, pyfiglet, logging, datetime, cv2
-from PIL import Image, ImageChops
-from fuzzywuzzy import fuzz
-import numpy as np
-import pandas as pd
+# heavy modules (requests, numpy, cv2, PIL, fuzzywuzzy, pyfiglet) are imported by the functions that use them, so startup stays fast
+import os, json, logging, datetime, hashlib, threading, heapq, argparse, csv, time
 
 
 # >> just for decoration
 def intro():
+    import pyfiglet
     print()
     print(pyfiglet.figlet_format("      GeekySid"))
     print()
@@ -116,6 +114,8 @@ def make_request(rapid_api_url: str, querystring: str)-> dict:
         dict: response from the request made to Rapid API
     """
 
+    import requests
+
     headers = {
         "X-RapidAPI-Key": CONFIG['rapid_api']['key'],
         "X-RapidAPI-Host": CONFIG['rapid_api']['host']
@@ -171,6 +171,8 @@ def get_profile_avatar(profile: dict) -> dict:
         dict: profile
     """    
 
+    import requests
+
     try:
         # Local folder where the image will be saved
         image_folder_path = os.path.join(OUTPUT_FOLDER, 'avatar')
@@ -263,6 +265,9 @@ def compare_avatar_old(searched_user_avatar: str, user_avatar:str ) -> float:
         float: score of the comparison
     """
 
+    import numpy as np
+    from PIL import Image, ImageChops
+
     if not user_avatar:
         return 0.0
 
@@ -294,6 +299,139 @@ def compare_avatar_old(searched_user_avatar: str, user_avatar:str ) -> float:
         return 0.0
 
 
+# >> in memory copy of avatar features, keyed by hash of the image bytes
+AVATAR_FEATURES = {}
+AVATAR_FILE_HASHES = {}
+
+
+# >> function to get hash of an avatar file without hashing the same file twice
+def get_avatar_hash(avatar_file: str) -> str:
+    """function to get sha1 hash of the content of an avatar file. Hash is remembered against path, size and modified time of file
+
+    Args:
+        avatar_file (str): complete path of the avatar
+
+    Returns:
+        str: hash of the image bytes, None if file can not be read
+    """
+
+    try:
+        stat = os.stat(avatar_file)
+        file_key = (avatar_file, stat.st_size, stat.st_mtime)
+        if file_key not in AVATAR_FILE_HASHES:
+            with open(avatar_file, 'rb') as r:
+                AVATAR_FILE_HASHES[file_key] = hashlib.sha1(r.read()).hexdigest()
+        return AVATAR_FILE_HASHES[file_key]
+    except OSError:
+        return None
+
+
+# >> function to compute grayscale histogram of an image
+def compute_avatar_features(content: bytes) -> dict:
+    """function to decode image bytes and compute features used for comparison
+
+    Args:
+        content (bytes): raw bytes of the image
+
+    Returns:
+        dict: features of the image, None if image can not be decoded
+    """
+
+    import numpy as np
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    histogram = cv2.calcHist([image_gray], [0], None, [256], [0, 256])
+    return {
+        "histogram": histogram.reshape(-1)
+    }
+
+
+# >> function to get features of an avatar from memory, disk or by decoding image
+def get_avatar_features(avatar_hash: str, content: bytes=None) -> dict:
+    """function to get features of an avatar. Features are computed only once for every image content and kept on disk between runs
+
+    Args:
+        avatar_hash (str): hash of the image bytes
+        content (bytes, optional): raw bytes of the image, used when features are not cached yet. Defaults to None.
+
+    Returns:
+        dict: features of the image, None if not available
+    """
+
+    import numpy as np
+
+    if not avatar_hash:
+        return None
+
+    # looking in memory
+    if avatar_hash in AVATAR_FEATURES:
+        return AVATAR_FEATURES[avatar_hash]
+
+    feature_folder = os.path.join(OUTPUT_FOLDER, "features")
+    feature_file = os.path.join(feature_folder, f"{avatar_hash}.npz")
+
+    # looking on disk
+    if os.path.exists(feature_file):
+        try:
+            with np.load(feature_file) as r:
+                features = { key: r[key] for key in r.files }
+            AVATAR_FEATURES[avatar_hash] = features
+            return features
+        except Exception as e:
+            debug(message=f"Exception while reading features file: {feature_file} || {e}", type="exception", separator="\n    [xx] ")
+
+    if content is None:
+        return None
+
+    # decoding image as features are not cached
+    features = compute_avatar_features(content)
+    if features is None:
+        return None
+    AVATAR_FEATURES[avatar_hash] = features
+
+    try:
+        if not os.path.exists(feature_folder):
+            os.makedirs(feature_folder, exist_ok=True)
+
+        # writing to temp file first so that a half written file is never read
+        temp_file = f"{feature_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'wb') as w:
+            np.savez(w, **features)
+        os.replace(temp_file, feature_file)
+    except Exception as e:
+        debug(message=f"Exception while saving features file: {feature_file} || {e}", type="exception", separator="\n    [xx] ")
+
+    return features
+
+
+# >> function to get grayscale histogram of an avatar file
+def get_avatar_histogram(avatar_file: str) -> "np.ndarray":
+    """function to get grayscale histogram of an avatar file using feature cache
+
+    Args:
+        avatar_file (str): complete path of the avatar
+
+    Returns:
+        numpy.ndarray: histogram with 256 bins, None if image can not be read
+    """
+
+    avatar_hash = get_avatar_hash(avatar_file)
+    if not avatar_hash:
+        return None
+
+    features = get_avatar_features(avatar_hash)
+    if features is None:
+        with open(avatar_file, 'rb') as r:
+            features = get_avatar_features(avatar_hash, r.read())
+
+    return features["histogram"] if features else None
+
+
 # >> comparing if 2 images are same
 def compare_avatar(searched_user_avatar: str, user_avatar:str ) -> float:
     """function to compare 2 images using pillow and numpy library
@@ -310,28 +448,75 @@ def compare_avatar(searched_user_avatar: str, user_avatar:str ) -> float:
         return 100000
 
     try:
-        original_image = cv2.imread(user_avatar)
-        original_image_gray = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
-        original_image_histogram = cv2.calcHist([original_image_gray], [0], None, [256], [0, 256])
+        # histograms are read from feature cache, image is decoded only when seen first time
+        original_image_histogram = get_avatar_histogram(user_avatar)
+        searched_image_histogram = get_avatar_histogram(searched_user_avatar)
+        if original_image_histogram is None or searched_image_histogram is None:
+            raise ValueError("could not decode avatar")
 
-        # data1 image
-        searched_image = cv2.imread(searched_user_avatar)
-        searched_image_gray = cv2.cvtColor(searched_image, cv2.COLOR_BGR2GRAY)
-        searched_image_histogram = cv2.calcHist([searched_image_gray], [0], None, [256], [0, 256])
+        # Euclidean Distance between data1 and test
+        return float(compare_avatar_histograms(searched_image_histogram, [original_image_histogram])[0])
+    except Exception as e:
+        debug(message=f"Got exception while comparing images. || {e}", type="exception", separator="\n    [xx] ")
+        return 100000
 
-        c1 = 0
 
-        # Euclidean Distance between data1 and test
-        i = 0
-        while i<len(original_image_histogram) and i<len(searched_image_histogram):
-            c1 += (original_image_histogram[i] - searched_image_histogram[i])**2
-            i += 1
-        c1 = c1**(1 / 2)
+# >> function to calculate euclidean distance between one histogram and many histograms in one go
+def compare_avatar_histograms(main_histogram: "np.ndarray", candidate_histograms: "np.ndarray") -> "np.ndarray":
+    """function to calculate euclidean distance between histogram of main profile and histograms of all candidates in a single array operation
+
+    Args:
+        main_histogram (numpy.ndarray): histogram of main profile's avatar with 256 bins
+        candidate_histograms (numpy.ndarray): matrix (N x 256) of histograms of candidate's avatars
+
+    Returns:
+        numpy.ndarray: N distances, same as avatar_similarity of compare_avatar
+    """
+
+    import numpy as np
+
+    main_histogram = np.asarray(main_histogram, dtype=np.float64).reshape(-1)
+    candidate_histograms = np.asarray(candidate_histograms, dtype=np.float64).reshape(-1, main_histogram.shape[0])
 
-        return c1.tolist()[0]
+    difference = candidate_histograms - main_histogram
+    return np.sqrt(np.einsum('ij,ij->i', difference, difference))
+
+
+# >> function to compare avatar of main profile with avatars of all candidates
+def compare_avatars_batch(original_avatar: str, matching_avatars: list) -> list:
+    """function to compare avatar of main profile with avatars of all candidates using one array operation
+
+    Args:
+        original_avatar (str): image of the actual profile
+        matching_avatars (list): images of the profiles searched
+
+    Returns:
+        list: score of the comparison for each of matching_avatars
+    """
+
+    import numpy as np
+
+    similarities = [100000] * len(matching_avatars)
+
+    try:
+        original_histogram = get_avatar_histogram(original_avatar)
+        if original_histogram is None:
+            raise ValueError("could not decode avatar")
+
+        indexes, histograms = [], []
+        for i, matching_avatar in enumerate(matching_avatars):
+            histogram = get_avatar_histogram(matching_avatar) if matching_avatar else None
+            if histogram is not None:
+                indexes.append(i)
+                histograms.append(histogram)
+
+        if histograms:
+            for i, distance in zip(indexes, compare_avatar_histograms(original_histogram, np.stack(histograms)).tolist()):
+                similarities[i] = distance
     except Exception as e:
         debug(message=f"Got exception while comparing images. || {e}", type="exception", separator="\n    [xx] ")
-        return 100000
+
+    return similarities
 
 
 # >> function to compare 2 strings
@@ -345,6 +530,8 @@ def compare_string(str1: str, str2: str) -> float:
     Returns:
         float: score of the comparison
     """
+    from fuzzywuzzy import fuzz
+
     try:
         ratio = fuzz.ratio(str1, str2)
     except Exception as e:
@@ -355,18 +542,21 @@ def compare_string(str1: str, str2: str) -> float:
 
 
 # function to compare avatar, bio and name of 2 profiles and give scores
-def compare_profiles(matching_profile: dict, original_profile: dict) -> dict:
+def compare_profiles(matching_profile: dict, original_profile: dict, avatar_similarity: float=None) -> dict:
     """function to compare avatar, bio and name of 2 profiles and give scores
 
     Args:
         matching_profile (dict): profile that is to be compared
         original_profile (dict): original profile 
+        avatar_similarity (float, optional): avatar distance already calculated by compare_avatars_batch. Defaults to None.
 
     Returns:
         dict: updated matching profile with score
     """
 
-    matching_profile["avatar_similarity"] = compare_avatar(original_profile['avatar'], matching_profile['avatar'])      # compare image
+    if avatar_similarity is None:
+        avatar_similarity = compare_avatar(original_profile['avatar'], matching_profile['avatar'])
+    matching_profile["avatar_similarity"] = avatar_similarity      # compare image
     matching_profile["name_similarity"] = compare_string(original_profile['fullname'], matching_profile['fullname'])        # compare name
     matching_profile["bio_similarity"] = compare_string(original_profile['bio'], matching_profile['bio'])       # compare bio
 
@@ -378,10 +568,40 @@ def compare_profiles(matching_profile: dict, original_profile: dict) -> dict:
     return matching_profile
 
 
+# >> function to get key on which matching profiles are ranked
+def get_ranking_key(matching_profile: dict) -> tuple:
+    """function to get key on which matching profiles are ranked, smaller key is closer match.
+        Profiles are ranked on comparison score and then on avatar distance.
+
+    Args:
+        matching_profile (dict): scored matching profile
+
+    Returns:
+        tuple: ranking key
+    """
+
+    return (-matching_profile["comparison_score"], matching_profile["avatar_similarity"])
+
+
+# >> function that takes list of matching profiles and returns top k profiles
+def get_top_matching_profiles(matching_profiles: list, k: int=1) -> list:
+    """function that takes list of matching profiles and returns top k profiles using heap based partial selection
+
+    Args:
+        matching_profiles (list): list of matching profiles
+        k (int, optional): number of profiles required. Defaults to 1.
+
+    Returns:
+        list: top k profiles, closest first
+    """
+
+    return heapq.nsmallest(k, matching_profiles, key=get_ranking_key)
+
+
 # >> function that takes list of matching profiles and returns profile with max score.
 def get_closest_matching_profile(matching_profiles: list) -> dict:
     """function that takes list of matching profiles and returns profile with max score.
-        If two dict have same avg, then one which highest score should be selected.
+        If two dict have same score, then one with closest avatar is selected.
 
     Args:
         matching_profiles (list): lis of matching profiles
@@ -390,32 +610,140 @@ def get_closest_matching_profile(matching_profiles: list) -> dict:
         dict: profile with max score
     """    
 
-    sorted_data = sorted(matching_profiles, key=lambda d: (-int(d['comparison_score']), -int(d['avatar_similarity'])))      # sort the data by avg and score
-    result = sorted_data[0]     # get the dictionary with highest avg and score
-    return result
-
+    return get_top_matching_profiles(matching_profiles, 1)[0]
 
-# >> function to save list of dict to csv
-def save_csv(profiles: list, file_name: str) -> None:
-    """function to save list of dict to csv
 
-    Args:
-        profiles (list): list of profiles
-        file_name (str): complete path of the file to save
+# >> writer that appends result rows to output file as soon as they are selected
+class ResultSink:
+    """writer that appends result rows to output file as soon as each main profile is selected, so memory stays flat and
+        partial results can be read while a long scan is running. Rows are written as csv, jsonl or parquet.
     """
-    try:
-        path = os.path.join(OUTPUT_FOLDER, "CSVs")
-        if not os.path.exists(path):
+
+    # extension of output file of every format
+    extensions = { "csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet" }
+
+    def __init__(self, file: str, format: str="csv", flush_rows: int=10, flush_seconds: float=2.0):
+        """
+        Args:
+            file (str): complete path of output file, extension is replaced by that of format
+            format (str, optional): csv, jsonl or parquet. Defaults to "csv".
+            flush_rows (int, optional): rows written before file is flushed. Defaults to 10.
+            flush_seconds (float, optional): seconds after which pending rows are flushed, even when no new row comes in. Defaults to 2.0.
+
+        Raises:
+            ImportError: format is parquet and pyarrow is not installed
+        """
+
+        if format == "parquet":
+            try:
+                import pyarrow, pyarrow.parquet
+            except ImportError as e:
+                raise ImportError(f"output format parquet needs pyarrow, install it with 'pip install pyarrow' or set output.format to csv or jsonl in config || {e}") from e
+
+        self.format = format
+        self.file = os.path.splitext(file)[0] + self.extensions[format]
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.handle = None
+        self.writer = None
+
+        path = os.path.dirname(self.file)
+        if path and not os.path.exists(path):
             os.makedirs(path)
 
-        # Convert the list of dictionaries to a pandas DataFrame
-        df = pd.DataFrame(profiles)
+        if format != "parquet":
+            self.handle = open(self.file, 'w', newline='', encoding='utf-8')
+
+        # pending rows are flushed in background, so a slow scan does not keep them off disk till next row comes in
+        self.stopped = threading.Event()
+        if flush_seconds:
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _flush_periodically(self) -> None:
+        while not self.stopped.wait(self.flush_seconds):
+            with self.lock:
+                if self.pending and time.monotonic() - self.last_flush >= self.flush_seconds:
+                    self._flush()
+
+    def write(self, rows: list) -> None:
+        """function to append rows of a main profile
+
+        Args:
+            rows (list): rows of output file
+        """
+
+        with self.lock:
+            self.pending.extend(rows)
+            self.rows += len(rows)
+            if len(self.pending) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self.pending:
+            if self.format == "csv":
+                if self.writer is None:
+                    # columns are taken from first row, later rows of same run have same columns
+                    self.writer = csv.DictWriter(self.handle, fieldnames=list(self.pending[0]), restval="", extrasaction="ignore")
+                    self.writer.writeheader()
+                self.writer.writerows(self.pending)
+            elif self.format == "jsonl":
+                self.handle.write("".join(json.dumps(row, default=str) + "\n" for row in self.pending))
+            else:
+                import pyarrow, pyarrow.parquet
+
+                # every flush becomes a row group, so only pending rows are held in memory
+                if self.writer is None:
+                    table = pyarrow.Table.from_pylist(self.pending)
+                    self.writer = pyarrow.parquet.ParquetWriter(self.file, table.schema)
+                else:
+                    table = pyarrow.Table.from_pylist(self.pending, schema=self.writer.schema)
+                self.writer.write_table(table)
+            self.pending = []
+
+        if self.handle:
+            self.handle.flush()
+        self.last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        """function to write pending rows to disk"""
+        with self.lock:
+            self._flush()
+
+    def close(self) -> None:
+        """function to write pending rows and close output file"""
+        self.stopped.set()
+        with self.lock:
+            self._flush()
+            if self.handle:
+                os.fsync(self.handle.fileno())
+                self.handle.close()
+                self.handle = None
+            elif self.writer:
+                self.writer.close()
+            self.writer = None
+
+
+# >> function to open result sink for output file as set in config
+def open_result_sink(file_name: str) -> ResultSink:
+    """function to open result sink for output file in CSVs folder, in format set in config
 
-        file_name = os.path.join(path, file_name)
-        # Save the DataFrame to a CSV file
-        df.to_csv(file_name, index=False)
-    except Exception as e:
-        debug(message=f"Exception while saving data to CSV file: {file_name} || {e}", type="exception", separator="\n    [xx] ")
+    Args:
+        file_name (str): name of output file
+
+    Returns:
+        ResultSink: opened result sink
+    """
+
+    return ResultSink(
+        os.path.join(OUTPUT_FOLDER, "CSVs", file_name),
+        format=CONFIG["output"]["format"],
+        flush_rows=CONFIG["output"]["flush_rows"],
+        flush_seconds=CONFIG["output"]["flush_seconds"]
+    )
 
 
 # >> save_json
@@ -453,7 +781,8 @@ def read_json(file: str) -> dict:
 # >> function where all magic happens
 def main():
     # looping through list of usernames
-    closest_matching_profiles = []
+    # rows of every account are appended to output file as soon as it is done
+    result_sink = open_result_sink(CSV_FILE)
     for i, username in enumerate(CONFIG['account'], start=1):
         debug(message=f"User: {username}", type="info", separator=f"\n[{i}] ")
         try:
@@ -501,37 +830,61 @@ def main():
 
             # get comparison score
             debug(message=f"Comparing each profile with @{username}", type="info", separator="    [>>] ")
-            matching_profiles = [ compare_profiles(matching_profile, user) for matching_profile in matching_profiles ]
+            avatar_similarities = compare_avatars_batch(user['avatar'], [ matching_profile['avatar'] for matching_profile in matching_profiles ])
+            matching_profiles = [ compare_profiles(matching_profile, user, avatar_similarity) for matching_profile, avatar_similarity in zip(matching_profiles, avatar_similarities) ]
 
             # get profile that is similar
             debug(message=f"Finding closest matching profile", type="info", separator="    [>>] ")
-            closest_profile = get_closest_matching_profile(matching_profiles)
-            debug(message=f"Closest Matching Profile: {closest_profile['username']}", type="info", separator="    [>>] ")
-
-            # adding closest matching profile to desired profiles list
-            closest_matching_profiles.append({
-                "Real Account": f"https://www.tiktok.com/@{username}",
-                "Fake Account Link": f"https://www.tiktok.com/@{closest_profile['username']}",
-                "Percentage": closest_profile["comparison_score"],
-                "Status": True if closest_profile["comparison_score"] >= CONFIG['min_fake_score'] else False
-            })
+            closest_profiles = get_top_matching_profiles(matching_profiles, CONFIG["top_k"])
+            debug(message=f"Closest Matching Profile: {closest_profiles[0]['username']}", type="info", separator="    [>>] ")
+
+            # adding closest matching profiles to desired profiles list
+            for rank, closest_profile in enumerate(closest_profiles, start=1):
+                row = {
+                    "Real Account": f"https://www.tiktok.com/@{username}",
+                    "Fake Account Link": f"https://www.tiktok.com/@{closest_profile['username']}",
+                    "Percentage": closest_profile["comparison_score"],
+                    "Status": True if closest_profile["comparison_score"] >= CONFIG['min_fake_score'] else False
+                }
+
+                # component scores of every suspect when more than one suspect is asked for
+                if CONFIG["top_k"] > 1:
+                    row["Rank"] = rank
+                    row["Avatar Similarity"] = closest_profile["avatar_similarity"]
+                    row["Name Similarity"] = closest_profile["name_similarity"]
+                    row["Bio Similarity"] = closest_profile["bio_similarity"]
+                result_sink.write([ row ])
 
             # Saving profiles to respective JSONs. ONLY FOR TESTING
             if CONFIG["save_json"]:
                 save_json(matching_profiles, f'{username}__matching_profiles_with_score.json')   # saving all matching profiles with scores locally
-                save_csv(matching_profiles, f"{username}.csv")      # converting json to csv files for testing
         
         except Exception as e:
             debug(message=f"Exception while getting matching profiles for user: {username} || {e}", type="exception", separator="\n    [xx] ")
 
-    # saving closest matching profiles in csv
-    if closest_matching_profiles:
-        save_csv(closest_matching_profiles, CSV_FILE)
+    result_sink.close()
+    if result_sink.rows:
+        debug(message=f"Rows saved to {result_sink.file} = {result_sink.rows}", type="info", separator=f"\n [+] ")
     else:
         debug(message=f"Not closest matching profiles profiles", type="error", separator="    [xx] ")
 
 
+# >> function to read command line arguments
+def parse_arguments() -> argparse.Namespace:
+    """function to read command line arguments. Without arguments script asks for output file
+
+    Returns:
+        argparse.Namespace: command line arguments
+    """
+
+    parser = argparse.ArgumentParser(description="Tiktok scraper to get closest matching profile")
+    parser.add_argument("--output", help="name of output file, skips the prompts")
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    arguments = parse_arguments()
+
     try:
         intro()
 
@@ -546,11 +899,14 @@ if __name__ == '__main__':
         #     BASE_FOLDER = input("Not a valid path. Please enter path to the project folder: ")
 
         #  getting name of output file
-        while True:
-            CSV_FILE = input("Please enter name of output file: ")
-            if CSV_FILE.endswith(".csv"):
-                break
-            CSV_FILE = input("File name must end with .csv. Please enter name of output file: ")
+        if arguments.output:
+            CSV_FILE = arguments.output if arguments.output.endswith(".csv") else f"{arguments.output}.csv"
+        else:
+            while True:
+                CSV_FILE = input("Please enter name of output file: ")
+                if CSV_FILE.endswith(".csv"):
+                    break
+                CSV_FILE = input("File name must end with .csv. Please enter name of output file: ")
 
         OUTPUT_FOLDER = os.path.join(BASE_FOLDER, "DATA")
         CONFIG = read_config()
@@ -561,7 +917,8 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"Exception in root: {e}")
 
-    input("\n All Task Done. Press Enter to close script ")
+    if not arguments.output:
+        input("\n All Task Done. Press Enter to close script ")
 
 
 # pyinstaller --onefile -c --icon=tiktok.ico --add-data "venv\Lib\site-packages\pyfiglet;./pyfiglet"  scraper.py
\ No newline at end of file
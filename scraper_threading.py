@@ -12,14 +12,14 @@
 
 
 # >> imports
-import requests, os, json, pyfiglet, logging, numpy
-import datetime, cv2, concurrent.futures, pandas
-from PIL import Image, ImageChops
-from fuzzywuzzy import fuzz
+# heavy modules (aiohttp, numpy, cv2, PIL, fuzzywuzzy, rapidfuzz, pyfiglet) are imported by the functions that use them, so startup stays fast
+import os, json, logging, asyncio, urllib.parse, argparse, queue, http.server, csv
+import datetime, concurrent.futures, hashlib, threading, time, random, sqlite3, multiprocessing, heapq, socket, contextlib, collections
 
 
 # >> just for decoration
 def intro():
+    import pyfiglet
     print()
     print(pyfiglet.figlet_format("      GeekySid"))
     print()
@@ -103,13 +103,614 @@ def read_config():
     print(f"Unable to locate config file as {config_path}")
 
 
+# >> counters and latency histograms of a run
+class Metrics:
+    """counters and latency histograms of a run. Metrics are keyed by name and labels, and snapshots taken in worker processes
+        can be merged back into metrics of main process.
+    """
+
+    # upper bounds in seconds of histogram buckets, last bucket takes everything above
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def get_key(name: str, labels: dict) -> tuple:
+        """function to get key of a metric
+
+        Args:
+            name (str): name of the metric
+            labels (dict): labels of the metric
+
+        Returns:
+            tuple: name and sorted labels
+        """
+
+        return (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+    def new_histogram(self) -> dict:
+        """function to get an empty histogram
+
+        Returns:
+            dict: bucket counts, sum, count, min and max of durations
+        """
+
+        return { "buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0, "min": None, "max": 0.0 }
+
+    def increment(self, name: str, value: float=1, **labels) -> None:
+        """function to add to a counter
+
+        Args:
+            name (str): name of the counter
+            value (float, optional): value to add. Defaults to 1.
+        """
+
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """function to add a duration to a histogram
+
+        Args:
+            name (str): name of the histogram
+            seconds (float): duration
+        """
+
+        key = self.get_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = self.new_histogram()
+
+            histogram["buckets"][next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            histogram["min"] = seconds if histogram["min"] is None else min(histogram["min"], seconds)
+            histogram["max"] = max(histogram["max"], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """function to time a block of code into a histogram
+
+        Args:
+            name (str): name of the histogram
+        """
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def quantile(self, histogram: dict, q: float) -> float:
+        """function to estimate a quantile from histogram buckets, assuming durations are spread evenly inside a bucket.
+            Estimate is kept between shortest and longest duration observed.
+
+        Args:
+            histogram (dict): histogram
+            q (float): quantile between 0 and 1
+
+        Returns:
+            float: estimated duration in seconds
+        """
+
+        shortest = histogram.get("min") or 0.0
+        rank = q * histogram["count"]
+        seen = 0
+        for i, count in enumerate(histogram["buckets"]):
+            if count and seen + count >= rank:
+                lower = max(self.buckets[i - 1] if i else 0.0, shortest)
+                upper = min(self.buckets[i] if i < len(self.buckets) else histogram["max"], histogram["max"])
+                return min(max(lower + (upper - lower) * (rank - seen) / count, shortest), histogram["max"])
+            seen += count
+        return histogram["max"]
+
+    def snapshot(self, reset: bool=False) -> dict:
+        """function to get all metrics as plain dict, that can be pickled or saved as JSON
+
+        Args:
+            reset (bool, optional): clear metrics after taking snapshot. Defaults to False.
+
+        Returns:
+            dict: counters and histograms
+        """
+
+        with self.lock:
+            snapshot = {
+                "counters": [ { "name": name, "labels": dict(labels), "value": value } for (name, labels), value in self.counters.items() ],
+                "histograms": [ dict(histogram, name=name, labels=dict(labels), buckets=list(histogram["buckets"])) for (name, labels), histogram in self.histograms.items() ]
+            }
+            if reset:
+                self.counters.clear()
+                self.histograms.clear()
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        """function to add metrics of a snapshot, e.g. one taken in a worker process
+
+        Args:
+            snapshot (dict): snapshot of other metrics
+        """
+
+        with self.lock:
+            for counter in snapshot["counters"]:
+                key = self.get_key(counter["name"], counter["labels"])
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+
+            for other in snapshot["histograms"]:
+                key = self.get_key(other["name"], other["labels"])
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = self.new_histogram()
+                histogram["buckets"] = [ a + b for a, b in zip(histogram["buckets"], other["buckets"]) ]
+                histogram["sum"] += other["sum"]
+                histogram["count"] += other["count"]
+                if other.get("min") is not None:
+                    histogram["min"] = other["min"] if histogram["min"] is None else min(histogram["min"], other["min"])
+                histogram["max"] = max(histogram["max"], other["max"])
+
+    def clear(self) -> None:
+        """function to clear all metrics"""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def format_name(name: str, labels: dict) -> str:
+        """function to format name and labels of a metric the way prometheus does
+
+        Args:
+            name (str): name of the metric
+            labels (dict): labels of the metric
+
+        Returns:
+            str: formatted name
+        """
+
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    @staticmethod
+    def format_value(value: float) -> str:
+        """function to format value of a counter without losing precision, whole numbers are written without decimals
+
+        Args:
+            value (float): value of the counter
+
+        Returns:
+            str: formatted value
+        """
+
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return repr(value)
+
+    def summary(self) -> str:
+        """function to format all metrics as table
+
+        Returns:
+            str: summary table
+        """
+
+        snapshot = self.snapshot()
+        lines = [ f"{'Timer':<60} {'Count':>8} {'Total s':>10} {'Mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'Max ms':>9}" ]
+        for histogram in sorted(snapshot["histograms"], key=lambda histogram: (histogram["name"], sorted(histogram["labels"].items()))):
+            lines.append(
+                f"{self.format_name(histogram['name'], histogram['labels']):<60} {histogram['count']:>8} {histogram['sum']:>10.2f} "
+                f"{histogram['sum'] / histogram['count'] * 1000 if histogram['count'] else 0:>9.1f} "
+                + " ".join(f"{self.quantile(histogram, q) * 1000:>9.1f}" for q in (0.5, 0.9, 0.99))
+                + f" {histogram['max'] * 1000:>9.1f}"
+            )
+
+        lines.append(f"{'Counter':<60} {'Value':>8}")
+        for counter in sorted(snapshot["counters"], key=lambda counter: (counter["name"], sorted(counter["labels"].items()))):
+            lines.append(f"{self.format_name(counter['name'], counter['labels']):<60} {self.format_value(counter['value']):>8}")
+        return "\n".join(lines)
+
+    def export_json(self, file: str) -> None:
+        """function to save all metrics as JSON
+
+        Args:
+            file (str): complete path of the JSON file
+        """
+
+        snapshot = self.snapshot()
+        snapshot["bucket_bounds"] = list(self.buckets)
+        temp_file = f"{file}.tmp"
+        with open(temp_file, 'w') as w:
+            json.dump(snapshot, w, indent=4)
+        os.replace(temp_file, file)
+
+    def prometheus(self, prefix: str="tiktok_scraper_") -> str:
+        """function to format all metrics in prometheus text format
+
+        Args:
+            prefix (str, optional): prefix added to name of every metric. Defaults to "tiktok_scraper_".
+
+        Returns:
+            str: metrics in prometheus text format
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted({ counter["name"] for counter in snapshot["counters"] }):
+            lines.append(f"# TYPE {prefix}{name} counter")
+            for counter in snapshot["counters"]:
+                if counter["name"] == name:
+                    lines.append(f"{self.format_name(prefix + name, counter['labels'])} {self.format_value(counter['value'])}")
+
+        for name in sorted({ histogram["name"] for histogram in snapshot["histograms"] }):
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for histogram in snapshot["histograms"]:
+                if histogram["name"] != name:
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ["+Inf"], histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{self.format_name(prefix + name + '_bucket', dict(histogram['labels'], le=bound))} {cumulative}")
+                lines.append(f"{self.format_name(prefix + name + '_sum', histogram['labels'])} {histogram['sum']}")
+                lines.append(f"{self.format_name(prefix + name + '_count', histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, file: str, prefix: str="tiktok_scraper_") -> None:
+        """function to save all metrics in prometheus text format, so that file can be picked by node exporter textfile collector
+
+        Args:
+            file (str): complete path of the .prom file
+            prefix (str, optional): prefix added to name of every metric. Defaults to "tiktok_scraper_".
+        """
+
+        # writing to temp file first so that collector never reads a half written file
+        temp_file = f"{file}.tmp"
+        with open(temp_file, 'w') as w:
+            w.write(self.prometheus(prefix))
+        os.replace(temp_file, file)
+
+
+# >> metrics of current run, worker processes keep their own and send snapshots back with results
+METRICS = Metrics()
+
+
+# >> asyncio http engine shared by every request made by the script
+class HttpEngine:
+    """asyncio based http engine that keeps pooled keep-alive connections and limits concurrency for each host.
+    Event loop runs in a background thread, so engine can be used from coroutines as well as from normal functions.
+    """
+
+    def __init__(self, timeout: int=10, host_limits: dict=None, default_host_limit: int=20, keepalive_timeout: int=30):
+        """
+        Args:
+            timeout (int, optional): total timeout of each request in seconds. Defaults to 10.
+            host_limits (dict, optional): max concurrent requests for a host, keyed by host name. Defaults to None.
+            default_host_limit (int, optional): max concurrent requests for hosts not in host_limits. Defaults to 20.
+            keepalive_timeout (int, optional): seconds an idle connection is kept open. Defaults to 30.
+        """
+
+        self.timeout = timeout
+        self.host_limits = host_limits or {}
+        self.default_host_limit = default_host_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.semaphores = {}
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="http-engine", daemon=True)
+        self.thread.start()
+        self.session = self.run(self._create_session())
+
+    async def _create_session(self) -> "aiohttp.ClientSession":
+        import aiohttp
+        # concurrency is limited per host by semaphores, so connector itself is not limited
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=self.keepalive_timeout, ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def _get_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlsplit(url).hostname or ""
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.host_limits.get(host, self.default_host_limit))
+        return self.semaphores[host]
+
+    async def get(self, url: str, params: dict=None, headers: dict=None) -> tuple:
+        """function to make a GET request
+
+        Args:
+            url (str): url to be requested
+            params (dict, optional): querystring of the request. Defaults to None.
+            headers (dict, optional): headers of the request. Defaults to None.
+
+        Returns:
+            tuple: status code, response headers and response body
+        """
+
+        async with self._get_semaphore(url):
+            async with self.session.get(url, params=params, headers=headers) as response:
+                return response.status, response.headers.copy(), await response.read()
+
+    def run(self, coroutine):
+        """function to run a coroutine on engine's event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        """function to close all connections and stop the event loop"""
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+HTTP_ENGINE = None
+
+
+# >> function to get http engine, engine is created on first use
+def get_http_engine() -> HttpEngine:
+    """function to get http engine, engine is created on first use
+
+    Returns:
+        HttpEngine: shared http engine
+    """
+
+    global HTTP_ENGINE
+    if HTTP_ENGINE is None:
+        HTTP_ENGINE = HttpEngine(
+            timeout=CONFIG["requests_timeout"],
+            host_limits=CONFIG["http"]["host_limits"],
+            default_host_limit=CONFIG["http"]["default_host_limit"],
+            keepalive_timeout=CONFIG["http"]["keepalive_timeout"]
+        )
+    return HTTP_ENGINE
+
+
+# >> token bucket rate limiter for Rapid API calls
+class RateLimiter:
+    """token bucket rate limiter for Rapid API calls. It backs off on 429 responses and keeps count of quota left on the api key."""
+
+    def __init__(self, requests_per_second: float, burst: int, max_retries: int=5, backoff_base: float=1, backoff_max: float=60):
+        """
+        Args:
+            requests_per_second (float): rate at which tokens are added to the bucket
+            burst (int): max tokens the bucket can hold
+            max_retries (int, optional): number of times a throttled request is retried. Defaults to 5.
+            backoff_base (float, optional): seconds to wait on first retry, doubled on every retry. Defaults to 1.
+            backoff_max (float, optional): max seconds to wait before a retry. Defaults to 60.
+        """
+
+        self.rate = requests_per_second
+        self.capacity = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+        self.quota_limit = None
+        self.quota_remaining = None
+        self.requests_made = 0
+        self.throttled_count = 0
+
+    async def acquire(self) -> None:
+        """function to wait till a token is available in the bucket and take it"""
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+
+                # whole bucket is paused after provider has throttled us
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, attempt: int, retry_after: str=None) -> float:
+        """function to pause the bucket after provider has throttled a request
+
+        Args:
+            attempt (int): number of retries already made for the request
+            retry_after (str, optional): value of Retry-After header. Defaults to None.
+
+        Returns:
+            float: seconds the bucket is paused for
+        """
+
+        self.throttled_count += 1
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            # jittered exponential backoff when provider does not tell us how long to wait
+            delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def update_quota(self, headers: dict) -> None:
+        """function to update quota left on the api key from headers of a response
+
+        Args:
+            headers (dict): headers of the response
+        """
+
+        self.requests_made += 1
+        try:
+            if headers.get("X-RateLimit-Requests-Limit") is not None:
+                self.quota_limit = int(headers["X-RateLimit-Requests-Limit"])
+            if headers.get("X-RateLimit-Requests-Remaining") is not None:
+                self.quota_remaining = int(headers["X-RateLimit-Requests-Remaining"])
+                return
+        except ValueError:
+            pass
+
+        if self.quota_remaining is not None:
+            self.quota_remaining -= 1
+
+
+RATE_LIMITER = None
+
+
+# >> function to get rate limiter of Rapid API, limiter is created on first use
+def get_rate_limiter() -> RateLimiter:
+    """function to get rate limiter of Rapid API, limiter is created on first use
+
+    Returns:
+        RateLimiter: shared rate limiter
+    """
+
+    global RATE_LIMITER
+    if RATE_LIMITER is None:
+        RATE_LIMITER = RateLimiter(
+            requests_per_second=CONFIG["rate_limit"]["requests_per_second"],
+            burst=CONFIG["rate_limit"]["burst"],
+            max_retries=CONFIG["rate_limit"]["max_retries"],
+            backoff_base=CONFIG["rate_limit"]["backoff_base"],
+            backoff_max=CONFIG["rate_limit"]["backoff_max"]
+        )
+    return RATE_LIMITER
+
+
+# >> on disk cache of Rapid API responses
+class ResponseCache:
+    """sqlite backed cache of Rapid API responses. Every endpoint has its own ttl and least recently used entries are removed once cache grows past max_entries."""
+
+    def __init__(self, file: str, ttls: dict, max_entries: int=50000):
+        """
+        Args:
+            file (str): complete path of the sqlite file
+            ttls (dict): seconds a response stays valid, keyed by endpoint name. Endpoints not listed are not cached.
+            max_entries (int, optional): max responses kept in cache. Defaults to 50000.
+        """
+
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, response TEXT, created_at REAL, accessed_at REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(endpoint: str, querystring: dict) -> str:
+        """function to get cache key from endpoint and normalized query parameters
+
+        Args:
+            endpoint (str): name of the endpoint
+            querystring (dict): payload passed to the api call
+
+        Returns:
+            str: cache key
+        """
+
+        normalized = sorted((str(key).strip().lower(), " ".join(str(value).lower().split())) for key, value in querystring.items())
+        return f"{endpoint}?{urllib.parse.urlencode(normalized)}"
+
+    def get(self, endpoint: str, querystring: dict) -> dict:
+        """function to get a cached response
+
+        Args:
+            endpoint (str): name of the endpoint
+            querystring (dict): payload passed to the api call
+
+        Returns:
+            dict: cached response, None if response is not cached or has expired
+        """
+
+        if not self.ttls.get(endpoint):
+            return None
+
+        key = self.get_key(endpoint, querystring)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttls[endpoint]:
+                self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self.connection.commit()
+                self.hits += 1
+                return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, endpoint: str, querystring: dict, response: dict) -> None:
+        """function to save a response in cache
+
+        Args:
+            endpoint (str): name of the endpoint
+            querystring (dict): payload passed to the api call
+            response (dict): response of the api call
+        """
+
+        if not self.ttls.get(endpoint):
+            return
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.get_key(endpoint, querystring), endpoint, json.dumps(response), now, now)
+            )
+
+            # removing least recently used responses every now and then rather than on every write
+            self.writes += 1
+            if self.writes % 100 == 0:
+                self.connection.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)", (self.max_entries,))
+            self.connection.commit()
+
+    def close(self) -> None:
+        """function to trim cache to max_entries and close the sqlite file"""
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)", (self.max_entries,))
+            self.connection.commit()
+            self.connection.close()
+
+
+RESPONSE_CACHE = None
+
+
+# >> function to get response cache, cache is opened on first use
+def get_response_cache() -> ResponseCache:
+    """function to get response cache, cache is opened on first use
+
+    Returns:
+        ResponseCache: shared response cache, None if cache is disabled in config
+    """
+
+    global RESPONSE_CACHE
+    if RESPONSE_CACHE is None and CONFIG["response_cache"]["enabled"]:
+        if not os.path.exists(OUTPUT_FOLDER):
+            os.makedirs(OUTPUT_FOLDER)
+
+        RESPONSE_CACHE = ResponseCache(
+            file=os.path.join(OUTPUT_FOLDER, CONFIG["response_cache"]["file"]),
+            ttls=CONFIG["response_cache"]["ttl"],
+            max_entries=CONFIG["response_cache"]["max_entries"]
+        )
+    return RESPONSE_CACHE
+
+
 # >> making request to tiktok using Rapid API
-def make_request(rapid_api_url: str, querystring: str)-> dict:
+async def make_request(rapid_api_url: str, querystring: str, on_rejected=None)-> dict:
     """function to make a request to RapidAPI to get a data
 
     Args:
         rapid_api_url (str): url of the rapid api
         querystring (str): payload to be passed to the api call
+        on_rejected (callable, optional): called when api answers that request can never succeed, e.g. user does not exist. Defaults to None.
 
     Returns:
         dict: response from the request made to Rapid API
@@ -120,15 +721,52 @@ def make_request(rapid_api_url: str, querystring: str)-> dict:
         "X-RapidAPI-Host": CONFIG['rapid_api']['host']
     }
 
+    # looking for response in cache first
+    endpoint = next((name for name, url in CONFIG['rapid_api'].items() if url == rapid_api_url), rapid_api_url)
+    response_cache = get_response_cache()
+    if response_cache:
+        cached_response = response_cache.get(endpoint, querystring)
+        if cached_response:
+            METRICS.increment("cache_hits_total", endpoint=endpoint)
+            return cached_response
+        METRICS.increment("cache_misses_total", endpoint=endpoint)
+
+    rate_limiter = get_rate_limiter()
     try:
-        response = requests.get(rapid_api_url, headers=headers, params=querystring)
-        if response.status_code == 200:
-            user_data = json.loads(response.text)
-            if "msg" in user_data and user_data["msg"].lower() == "success":
-                return json.loads(response.text)
-        debug(message=f"Got {response.status_code}", type="error", separator="\n    [xx] ")
+        for attempt in range(rate_limiter.max_retries + 1):
+            await rate_limiter.acquire()
+            with METRICS.timer("api_request_seconds", endpoint=endpoint):
+                status, response_headers, content = await get_http_engine().get(rapid_api_url, params=querystring, headers=headers)
+            rate_limiter.update_quota(response_headers)
+            METRICS.increment("api_responses_total", endpoint=endpoint, status=status)
+            METRICS.increment("bytes_downloaded_total", len(content or b""), kind="api")
+
+            # retrying throttled request after backing off
+            if status in (429, 503) and attempt < rate_limiter.max_retries:
+                delay = rate_limiter.throttled(attempt, response_headers.get("Retry-After"))
+                METRICS.increment("api_retries_total", endpoint=endpoint)
+                debug(message=f"Got {status}, retrying in {delay:.1f} seconds", type="warning", separator="\n    [!!] ")
+                continue
+
+            if status == 200:
+                user_data = json.loads(content)
+                if "msg" in user_data and user_data["msg"].lower() == "success":
+                    if response_cache:
+                        response_cache.set(endpoint, querystring, user_data)
+                    return user_data
+
+                # api has answered, but not with data. Trying again gives same answer
+                if on_rejected:
+                    on_rejected()
+                debug(message=f"Got {status} || {user_data.get('msg')}", type="error", separator="\n    [xx] ")
+                break
+            if status in (400, 404) and on_rejected:
+                on_rejected()
+            debug(message=f"Got {status}", type="error", separator="\n    [xx] ")
+            break
     except Exception as e:
         debug(message=f"Exception while making request || {e}", type="exception", separator="\n    [xx] ")
+    METRICS.increment("api_failures_total", endpoint=endpoint)
     return None
 
 
@@ -157,6 +795,28 @@ def read_input(file_name: str) -> list:
     return profiles
 
 
+# >> read input file one profile at a time
+def iter_input(file_name: str):
+    """function to read profiles from input file one at a time, so that big input files are never held in memory
+
+    Args:
+        file_name (str): name of input file
+
+    Yields:
+        str: username of profile
+    """
+
+    file = os.path.join(BASE_FOLDER, file_name)
+    if not os.path.exists(file):
+        return
+
+    with open(file, 'r') as r:
+        for line in r:
+            profile = line.strip().split("/@")[-1]
+            if profile:
+                yield profile
+
+
 # >> formatting user details
 def get_user_detail(user_data: dict) -> dict:
     """function to format user details from user dict
@@ -177,15 +837,52 @@ def get_user_detail(user_data: dict) -> dict:
     return {
         "username": "uniqueId" in user_data and user_data["uniqueId"] or "",
         "avatar_url": ('avatarMedium' in user_data and user_data['avatarMedium']) or ('avatarThumb' in user_data and user_data['avatarThumb']) or "",
-        "avatar_file": f'{"uniqueId" in user_data and user_data["uniqueId"] or ""}.jpeg',
+        "avatar_file": "",
+        "avatar_hash": "",
         "fullname": "nickname" in user_data and user_data["nickname"] or "",
         "bio": "signature" in user_data and user_data["signature"] or "",
         "follower_count": "followerCount" in user_stats and user_stats["followerCount"] or 0
     }
 
 
+# >> searches made in current run, keyed by normalized keyword
+SEARCH_REQUESTS = {}
+
+
 # >> function to get matching profile depending on a keyword
-def get_matching_profiles(keyword: str, count: int=30) -> list:
+async def get_matching_profiles(keyword: str, count: int=30) -> list:
+    """function that gets matching profiles for a given keyword. Same keyword is searched only once in a run,
+        concurrent and later calls for it wait on the first search and share its result. A search that fails or finds
+        nothing is not kept, so later calls search again.
+
+    Args:
+        keyword (str): keyword
+        count (int, optional): number of matching profiles required. Defaults to 30.
+
+    Returns:
+        list: serialized list of profiles
+    """
+
+    keyword_key = " ".join(keyword.lower().split())
+    if keyword_key not in SEARCH_REQUESTS:
+        SEARCH_REQUESTS[keyword_key] = asyncio.ensure_future(search_matching_profiles(keyword, count))
+    else:
+        debug(message=f"Sharing search result for {keyword}", type="debug", separator="\n    [>>] ")
+
+    search_request = SEARCH_REQUESTS[keyword_key]
+    matching_profiles = None
+    try:
+        matching_profiles = await search_request
+    finally:
+        if not matching_profiles and SEARCH_REQUESTS.get(keyword_key) is search_request:
+            del SEARCH_REQUESTS[keyword_key]
+
+    # every main profile gets its own copy as scores are saved on the profiles
+    return [ dict(profile) for profile in matching_profiles if profile ]
+
+
+# >> function to search matching profile depending on a keyword
+async def search_matching_profiles(keyword: str, count: int=30) -> list:
     """function that fetches matching profiles for a given keyword
 
     Args:
@@ -199,7 +896,7 @@ def get_matching_profiles(keyword: str, count: int=30) -> list:
     profiles = []
 
     # get profiles with matching name:
-    matching_profiles = make_request(CONFIG['rapid_api']['search_profiles_url'], {"keywords": keyword, "count":"30", "cursor":"0"})
+    matching_profiles = await make_request(CONFIG['rapid_api']['search_profiles_url'], {"keywords": keyword, "count":"30", "cursor":"0"})
     if not matching_profiles:
         debug(message=f"Could not get matching profiles for {keyword}", type="error", separator="\n    [xx] ")
         return []
@@ -214,30 +911,6 @@ def get_matching_profiles(keyword: str, count: int=30) -> list:
     return profiles
 
 
-# >> downloading profile image 
-def get_profile_avatar(avatar_url: str, avatar_file: str) -> None:
-    """function to download avatar from user json and save in locally
-
-    Args:
-        avatar_url (dict): url from here imag is to be downloaded
-        avatar_file (str): name of the file of image
-
-    """    
-
-    try:
-        if avatar_url:
-            print(f"  [>>] Downloading Avatar for {avatar_file.replace('.jpeg', '')}")
-            avatar_file = os.path.join(AVATAR_FOLDER, f"{avatar_file}")
-
-            # Download the image and save it to the local folder
-            response = requests.get(avatar_url)
-            with open(avatar_file, "wb") as f:
-                f.write(response.content)
-    except Exception as e:
-        # debug(message=f"Exception wile downloading Image", type="exception", separator="\n    [xx] ")
-        pass
-
-
 # >> function to remove duplicate profile from list that has same username
 def sanitize_matching_profiles(profiles: list, main_username:str) -> list:
     """function to remove duplicate profile from list that has same username
@@ -275,6 +948,9 @@ def compare_avatar_old(searched_user_avatar: str, user_avatar:str ) -> float:
         float: score of the comparison
     """
 
+    import numpy
+    from PIL import Image, ImageChops
+
     if not user_avatar:
         return 0.0
 
@@ -306,348 +982,2519 @@ def compare_avatar_old(searched_user_avatar: str, user_avatar:str ) -> float:
         return 0.0
 
 
-# >> comparing if 2 images are same
-def compare_avatar(searched_user_avatar: str, user_avatar:str ) -> float:
-    """function to compare 2 images using pillow and numpy library
-
-    Args:
-        searched_user_avatar (str): image of the profiles searched
-        user_avatar (str): image of the actual profile
-
-    Returns:
-        float: score of the comparison
+# >> dict that keeps only the entries used most recently
+class LRUCache:
+    """thread safe dict that keeps only max_entries entries, entry used least recently is removed first.
+        It keeps memory of long running service bounded.
     """
 
-    user_avatar = os.path.join(OUTPUT_FOLDER, "avatar", user_avatar)
-    searched_user_avatar = os.path.join(OUTPUT_FOLDER, "avatar", searched_user_avatar)
+    def __init__(self, max_entries: int):
+        """
+        Args:
+            max_entries (int): max entries kept
+        """
 
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
 
-    if not(os.path.exists(user_avatar) and os.path.exists(searched_user_avatar)):
-        return 10000000
+    def get(self, key, default=None):
+        """function to get value of a key and mark it used
 
-    try:
-        original_image = cv2.imread(user_avatar)
-        original_image_gray = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
-        original_image_histogram = cv2.calcHist([original_image_gray], [0], None, [256], [0, 256])
+        Args:
+            key: key of the entry
+            default (optional): value returned when key is not found. Defaults to None.
 
-        # data1 image
-        searched_image = cv2.imread(searched_user_avatar)
-        searched_image_gray = cv2.cvtColor(searched_image, cv2.COLOR_BGR2GRAY)
-        searched_image_histogram = cv2.calcHist([searched_image_gray], [0], None, [256], [0, 256])
+        Returns:
+            value of the entry, default if not found
+        """
 
-        c1 = 0
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
 
-        # Euclidean Distance between data1 and test
-        i = 0
-        while i<len(original_image_histogram) and i<len(searched_image_histogram):
-            c1 += (original_image_histogram[i] - searched_image_histogram[i])**2
-            i += 1
-        c1 = c1**(1 / 2)
+    def __setitem__(self, key, value) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
 
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.entries
 
-        return c1.tolist()[0]
-    except Exception as e:
-        debug(message=f"Got exception while comparing images. || {e}", type="exception", separator="\n    [xx] ")
-        return 100000
+    def __len__(self) -> int:
+        return len(self.entries)
 
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
 
-# >> function to compare 2 strings
-def compare_string(str1: str, str2: str) -> float:
-    """function to compare 2 strings by using fuzzy logic
 
-    Args:
-        str1 (str): first string 
-        str2 (str): second string
+# >> in memory copy of avatar features, keyed by hash of the image bytes, and hashes of avatar files, keyed by path, size and modified time
+AVATAR_FEATURES = LRUCache(20000)
+AVATAR_FILE_HASHES = LRUCache(50000)
 
-    Returns:
-        float: score of the comparison
-    """
-    try:
-        if str1 and str2:
-            ratio = fuzz.ratio(str1, str2)
-        else: ratio = 0
-    except Exception as e:
-        debug(message=f"Got exception while comparing strings. || {e}", type="exception", separator="\n    [xx] ")
-        ratio = 0
-    
-    return ratio
+# features every cached entry must have, entries saved by older versions without some of them are computed again
+AVATAR_FEATURE_KEYS = ("histogram", "dhash", "thumbnail")
 
 
-# function to compare avatar, bio and name of 2 profiles and give scores
-def compare_profiles(original_profile: dict, matching_profile: dict) -> dict:
-    """function to compare avatar, bio and name of 2 profiles and give scores
+# >> function to get hash of an avatar file without hashing the same file twice
+def get_avatar_hash(avatar_file: str) -> str:
+    """function to get sha1 hash of the content of an avatar file. Hash is remembered against path, size and modified time of file
 
     Args:
-        original_profile (dict): original profile
-        matching_profile (dict): profile that is to be compared
+        avatar_file (str): complete path of the avatar
 
     Returns:
-        dict: updated matching profile with score
+        str: hash of the image bytes, None if file can not be read
     """
 
-    matching_profile["avatar_similarity"] = compare_avatar(original_profile['avatar_file'], matching_profile['avatar_file'])      # compare image
-    matching_profile["name_similarity"] = compare_string(original_profile['fullname'], matching_profile['fullname'])        # compare name
-    matching_profile["bio_similarity"] = compare_string(original_profile['bio'], matching_profile['bio'])       # compare bio
-
-    # calculating score
-    avatar_similarity = 1 if matching_profile["avatar_similarity"] <= CONFIG["min_similarity"]["avatar"] else 0
-    name_similarity = 1 if matching_profile["name_similarity"] >= CONFIG["min_similarity"]["name"] else 0
-    bio_similarity = 1 if matching_profile["bio_similarity"] >= CONFIG["min_similarity"]["bio"] else 0
-    matching_profile["comparison_score"] = (avatar_similarity * CONFIG["weightage"]["avatar"]) + (name_similarity * CONFIG["weightage"]["name"]) + (bio_similarity * CONFIG["weightage"]["bio"])
-    return matching_profile
+    try:
+        stat = os.stat(avatar_file)
+        file_key = (avatar_file, stat.st_size, stat.st_mtime)
+        avatar_hash = AVATAR_FILE_HASHES.get(file_key)
+        if avatar_hash is None:
+            with open(avatar_file, 'rb') as r:
+                avatar_hash = hashlib.sha1(r.read()).hexdigest()
+            AVATAR_FILE_HASHES[file_key] = avatar_hash
+        return avatar_hash
+    except OSError:
+        return None
 
 
-# >> function that takes list of matching profiles and returns profile with max score.
-def get_closest_matching_profile(matching_profiles: list) -> dict:
-    """function that takes list of matching profiles and returns profile with max score.
-        If two dict have same avg, then one which highest score should be selected.
+# >> function to compute grayscale histogram of an image
+def compute_avatar_features(content: bytes) -> dict:
+    """function to decode image bytes and compute features used for comparison
 
     Args:
-        matching_profiles (list): lis of matching profiles
+        content (bytes): raw bytes of the image
 
     Returns:
-        dict: profile with max score
+        dict: features of the image, None if image can not be decoded
     """
-    try:
-        # Custom sorting key function
-        def sorting_key(dictionary):
-            return (-dictionary["comparison_score"], dictionary["avatar_similarity"])
 
-        # Sort the list
-        sorted_data = sorted(matching_profiles, key=sorting_key)
+    import numpy, cv2
 
-        # Get the maximum score
-        max_score = sorted_data[0]["comparison_score"]
+    with METRICS.timer("avatar_decode_seconds"):
+        image = cv2.imdecode(numpy.frombuffer(content, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        METRICS.increment("avatar_decode_failures_total")
+        return None
 
-        # Filter dictionaries with the maximum score
-        filtered_data = [d for d in sorted_data if d["comparison_score"] == max_score]
+    with METRICS.timer("avatar_histogram_seconds"):
+        image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        histogram = cv2.calcHist([image_gray], [0], None, [256], [0, 256])
 
-        # Sort the filtered data based on age
-        final_sorted_data = sorted(filtered_data, key=lambda x: x["avatar_similarity"])
+        # difference hash, each bit tells if a pixel is brighter than pixel on its left in 9x8 thumbnail
+        thumbnail = cv2.resize(image_gray, (9, 8), interpolation=cv2.INTER_AREA)
+        dhash = 0
+        for bit in (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten():
+            dhash = (dhash << 1) | int(bit)
 
-        # sorted_data = sorted(matching_profiles, key=lambda d: (-int(d['comparison_score']), -int(d['avatar_similarity'])))      # sort the data by avg and score
-        result = final_sorted_data[0]     # get the dictionary with highest avg and score
-        return result
-    except Exception as e:
-        debug(message=f"Exception while getting closest match || {e}", type="exception", separator="\n     [>>] ")
         return {
-            "username": f"Exception while getting closest match || {e}",
-            "comparison_score": 0
+            "histogram": histogram.reshape(-1),
+            "dhash": numpy.array(dhash, dtype=numpy.uint64),
+            "thumbnail": cv2.resize(image_gray, (64, 64), interpolation=cv2.INTER_AREA)
         }
 
 
-# >> function to save list of dict to csv
-def save_csv(profiles: list, file_name: str) -> None:
-    """function to save list of dict to csv
+# >> function to get features of an avatar from memory, disk or by decoding image
+def get_avatar_features(avatar_hash: str, content: bytes=None) -> dict:
+    """function to get features of an avatar. Features are computed only once for every image content and kept on disk between runs.
+        Cached features missing any of AVATAR_FEATURE_KEYS are treated as not cached.
 
     Args:
-        profiles (list): list of profiles
-        file_name (str): complete path of the file to save
+        avatar_hash (str): hash of the image bytes
+        content (bytes, optional): raw bytes of the image, used when features are not cached yet. Defaults to None.
+
+    Returns:
+        dict: features of the image, None if not available
     """
-    try:
-        path = os.path.join(OUTPUT_FOLDER, "CSVs")
-        if not os.path.exists(path):
-            os.makedirs(path)
 
-        # Convert the list of dictionaries to a pandas DataFrame
-        df = pandas.DataFrame(profiles)
+    import numpy
 
-        file_name = os.path.join(path, file_name)
-        # Save the DataFrame to a CSV file
-        df.to_csv(file_name, index=False)
-    except Exception as e:
-        debug(message=f"Exception while saving data to CSV file: {file_name} || {e}", type="exception", separator="\n    [xx] ")
+    if not avatar_hash:
+        return None
 
+    # looking in memory
+    features = AVATAR_FEATURES.get(avatar_hash)
+    if features is not None and all(key in features for key in AVATAR_FEATURE_KEYS):
+        return features
 
-# >> save_json
-def save_json(json_data: dict, file: str) -> None:
-    try:
-        # creating path for output file
-        path = os.path.join(OUTPUT_FOLDER, "JSONs")
-        if not os.path.exists(path):
-            os.makedirs(path)
+    feature_folder = os.path.join(OUTPUT_FOLDER, "features")
+    feature_file = os.path.join(feature_folder, f"{avatar_hash}.npz")
 
-        file = os.path.join(path, file)
-        with open(file, 'w') as w:
-            json.dump(json_data, w, indent=4)
-    except Exception as e:
-        debug(message=f"Exception while saving data to JSON file: {file} || {e}", type="exception", separator="\n    [xx] ")
+    # looking on disk
+    if os.path.exists(feature_file):
+        try:
+            with numpy.load(feature_file) as r:
+                features = { key: r[key] for key in r.files }
+            if all(key in features for key in AVATAR_FEATURE_KEYS):
+                AVATAR_FEATURES[avatar_hash] = features
+                return features
+        except Exception as e:
+            debug(message=f"Exception while reading features file: {feature_file} || {e}", type="exception", separator="\n    [xx] ")
 
+    if content is None:
+        return None
 
-# >> read json
-def read_json(file: str) -> dict:
-    try:
-        # creating path for output file
-        path = os.path.join(OUTPUT_FOLDER, "JSONs")
-        file = os.path.join(path, file)
+    # decoding image as features are not cached
+    features = compute_avatar_features(content)
+    if features is None:
+        return None
+    AVATAR_FEATURES[avatar_hash] = features
 
-        if os.path.exists(file):
-            with open(file, 'r') as r:
-                return json.load(r)
-        else:
-            # debug(message=f" File not found: {file}", type="error", separator="\n [xx] ")
-            return {}
+    try:
+        if not os.path.exists(feature_folder):
+            os.makedirs(feature_folder, exist_ok=True)
+
+        # writing to temp file first so that a half written file is never read
+        temp_file = f"{feature_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'wb') as w:
+            numpy.savez(w, **features)
+        os.replace(temp_file, feature_file)
     except Exception as e:
-        debug(message=f"Exception while reading file: {file} || {e}", type="exception", separator="\n    [xx] ")
+        debug(message=f"Exception while saving features file: {feature_file} || {e}", type="exception", separator="\n    [xx] ")
 
+    return features
 
-# >> function to get user profile and get its matching profile. Function is intended to run in multiple threads.
-def get_profile_data_thread(main_profile):
 
-    """function to get user profile and get its matching profile. Function is intended to run in multiple threads.
+# >> function to get grayscale histogram of an avatar file
+def get_avatar_histogram(avatar_file: str) -> "numpy.ndarray":
+    """function to get grayscale histogram of an avatar file using feature cache
 
     Args:
-        main_profile (_type_): _description_
-    """
-    debug(message=f"User: {main_profile} || Getting User Info and Matching profiles.", type="info", separator=f"\n    [>] ")
-    try:
-        # get user info
-        user_profile = make_request(CONFIG['rapid_api']['user_info_url'], {"unique_id":f"@{main_profile}"})
-        if not user_profile:
-            debug(message=f"Could not get user info for {main_profile}", type="error", separator="\n    [xx] ")
-            return
+        avatar_file (str): complete path of the avatar
 
-        user = get_user_detail(user_profile["data"])
-        if not user:
-            debug(message=f"Could not get user detail for {main_profile}", type="error", separator="\n    [xx] ")
-            return
-
-        # get profiles with matching name
-        matching_profiles = []
-        if user['fullname']:
-            matching_profiles += get_matching_profiles(user['fullname'], count=30)
+    Returns:
+        numpy.ndarray: histogram with 256 bins, None if image can not be read
+    """
 
-        # get profiles with matching username
-        if main_profile:
-            matching_profiles += get_matching_profiles(main_profile, count=30)
-        
-        matching_profiles = sanitize_matching_profiles(matching_profiles, main_profile)
+    avatar_hash = get_avatar_hash(avatar_file)
+    if not avatar_hash:
+        return None
 
-        final_data = {
-            "main_profile": user,
-            "matching_profiles": matching_profiles
-        }
+    features = get_avatar_features(avatar_hash)
+    if features is None:
+        with open(avatar_file, 'rb') as r:
+            features = get_avatar_features(avatar_hash, r.read())
 
-        # Saving profiles to respective JSONs. ONLY FOR TESTING
-        save_json(final_data, f"{main_profile}.json")
-    except Exception as e:
-        debug(message=f"Exception while getting matching profiles for user: {main_profile} || {e}", type="exception", separator="\n    [xx] ")
+    return features["histogram"] if features else None
 
 
-# >> function to download avatars. . Function is intended to run in multiple threads.
-def download_avatar_thread(avatar_url: str, avatar_file: str):
-    """function to download avatars. Function is intended to run in multiple threads.
+# >> comparing if 2 images are same
+def compare_avatar(searched_user_avatar: str, user_avatar:str ) -> float:
+    """function to compare 2 images using pillow and numpy library
 
     Args:
-        avatar_url (dict): url from here imag is to be downloaded
-        avatar_file (str): name of the file of image
+        searched_user_avatar (str): image of the profiles searched
+        user_avatar (str): image of the actual profile
+
+    Returns:
+        float: score of the comparison
     """
 
+    if not (user_avatar and searched_user_avatar):
+        return 10000000
+
+    user_avatar = os.path.join(OUTPUT_FOLDER, "avatar", user_avatar)
+    searched_user_avatar = os.path.join(OUTPUT_FOLDER, "avatar", searched_user_avatar)
+
+
+    if not(os.path.exists(user_avatar) and os.path.exists(searched_user_avatar)):
+        return 10000000
+
     try:
-        if avatar_url:
-            avatar_file = os.path.join(AVATAR_FOLDER, f"{avatar_file}")
+        # histograms are read from feature cache, image is decoded only when seen first time
+        original_image_histogram = get_avatar_histogram(user_avatar)
+        searched_image_histogram = get_avatar_histogram(searched_user_avatar)
+        if original_image_histogram is None or searched_image_histogram is None:
+            raise ValueError("could not decode avatar")
 
-            # Download the image and save it to the local folder
-            response = requests.get(avatar_url, timeout=CONFIG["requests_timeout"])
-            with open(avatar_file, "wb") as f:
-                f.write(response.content)
+        # Euclidean Distance between data1 and test
+        return float(compare_avatar_histograms(searched_image_histogram, [original_image_histogram])[0])
     except Exception as e:
-        # debug(message=f"Exception wile downloading Image || {e}", type="exception", separator="\n    [xx] ")
-        pass
+        debug(message=f"Got exception while comparing images. || {e}", type="exception", separator="\n    [xx] ")
+        return 100000
 
 
-# >> function to calculate comparison score between each matching profiles and main profile. Function is intended to run in multiple threads.
-def profile_comparison(main_profile: str) -> None:
-    """function to calculate comparison score between each matching profiles and main profile. Function is intended to run in multiple threads.
+# >> function to calculate euclidean distance between one histogram and many histograms in one go
+def compare_avatar_histograms(main_histogram: "numpy.ndarray", candidate_histograms: "numpy.ndarray") -> "numpy.ndarray":
+    """function to calculate euclidean distance between histogram of main profile and histograms of all candidates in a single array operation
 
     Args:
-        main_profile (str): username of the main_account
+        main_histogram (numpy.ndarray): histogram of main profile's avatar with 256 bins
+        candidate_histograms (numpy.ndarray): matrix (N x 256) of histograms of candidate's avatars
+
+    Returns:
+        numpy.ndarray: N distances, same as avatar_similarity of compare_avatar
     """
 
-    main_profile_data = read_json(f"{main_profile}.json")
+    import numpy
 
-    # get comparison score
-    main_profile_data["matching_profiles"] = [ compare_profiles(main_profile_data["main_profile"], matching_profile) for matching_profile in main_profile_data["matching_profiles"] ]
-    save_json(main_profile_data, f"{main_profile}.json")
+    main_histogram = numpy.asarray(main_histogram, dtype=numpy.float64).reshape(-1)
+    candidate_histograms = numpy.asarray(candidate_histograms, dtype=numpy.float64).reshape(-1, main_histogram.shape[0])
 
+    difference = candidate_histograms - main_histogram
+    return numpy.sqrt(numpy.einsum('ij,ij->i', difference, difference))
 
-# >> function where all magic happens
-def main():
 
-    # ! READ INPUT FILE 
-    main_profiles = list(set(read_input(CONFIG["input_file"])))
-    debug(message=f"Total number of main profiles = {len(main_profiles)}", type="info", separator=f"\n [+] ")
+# >> function to get histogram of an avatar kept in avatar store
+def get_stored_avatar_histogram(avatar_hash: str) -> "numpy.ndarray":
+    """function to get histogram of an avatar kept in avatar store, image is decoded only if features are not cached
 
+    Args:
+        avatar_hash (str): hash of the image bytes
 
-    # ! LOOP THROUGH PROFILE AND GET MATCHING PROFILES AND SAVE EACH PROFILE WITH USERNAME AS JSON 
-    debug(message=f"Getting Matching Profiles for each Main Profile", type="info", separator=f"\n [+] ")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG["max_worker_count"]) as matching_profile_thread:
-        matching_profile_thread.map(get_profile_data_thread, main_profiles)
-    debug(message=f"Scraped all Matching Profiles for each Main Profile", type="info", separator=f"\n [+] ")
+    Returns:
+        numpy.ndarray: histogram with 256 bins, None if image is not found or can not be decoded
+    """
+
+    features = get_avatar_features(avatar_hash)
+    if features is None:
+        avatar_file = os.path.join(AVATAR_FOLDER, f"{avatar_hash}.jpeg")
+        if not os.path.exists(avatar_file):
+            return None
+
+        with open(avatar_file, 'rb') as r:
+            features = get_avatar_features(avatar_hash, r.read())
+
+    return features["histogram"] if features else None
+
+
+# >> function to compare avatar of main profile with avatars of all candidates
+def compare_avatars_batch(original_avatar_hash: str, matching_avatar_hashes: list) -> list:
+    """function to compare avatar of main profile with avatars of all candidates using one array operation.
+        Avatars with same content as avatar of main profile get distance 0 without decoding either image.
+
+    Args:
+        original_avatar_hash (str): hash of image of the actual profile
+        matching_avatar_hashes (list): hashes of images of the profiles searched
+
+    Returns:
+        list: score of the comparison for each of matching_avatar_hashes
+    """
+
+    import numpy
+
+    similarities = [10000000] * len(matching_avatar_hashes)
+    if not (matching_avatar_hashes and original_avatar_hash):
+        return similarities
+
+    try:
+        original_histogram = None
+        indexes, histograms = [], []
+        for i, matching_avatar_hash in enumerate(matching_avatar_hashes):
+            if not matching_avatar_hash:
+                continue
+
+            # exact copy of the avatar
+            if matching_avatar_hash == original_avatar_hash:
+                similarities[i] = 0.0
+                continue
+
+            if original_histogram is None:
+                original_histogram = get_stored_avatar_histogram(original_avatar_hash)
+                if original_histogram is None:
+                    raise ValueError("could not decode avatar")
+
+            histogram = get_stored_avatar_histogram(matching_avatar_hash)
+            if histogram is None:
+                similarities[i] = 100000
+                continue
+
+            indexes.append(i)
+            histograms.append(histogram)
+
+        if histograms:
+            for i, distance in zip(indexes, compare_avatar_histograms(original_histogram, numpy.stack(histograms)).tolist()):
+                similarities[i] = distance
+    except Exception as e:
+        debug(message=f"Got exception while comparing images. || {e}", type="exception", separator="\n    [xx] ")
+        similarities = [ 0.0 if matching_avatar_hash and matching_avatar_hash == original_avatar_hash else 100000 for matching_avatar_hash in matching_avatar_hashes ]
+
+    return similarities
+
+
+# >> function to get perceptual hash of an avatar
+def get_avatar_dhash(avatar_hash: str) -> int:
+    """function to get 64 bit difference hash of an avatar from feature cache
+
+    Args:
+        avatar_hash (str): hash of the image bytes
+
+    Returns:
+        int: difference hash, None if features of avatar are not available
+    """
+
+    features = get_avatar_features(avatar_hash)
+    if not features or "dhash" not in features:
+        return None
+    return int(features["dhash"])
+
+
+# >> persistent index of perceptual hashes of all avatars ever seen
+class AvatarIndex:
+    """BK-tree of perceptual hashes of every avatar ever seen, saved on disk between runs.
+        It answers which known avatars are within a hamming distance of an avatar without scanning all of them.
+    """
+
+    # max candidate labels kept for a hash, default avatars are shared by thousands of accounts
+    max_candidate_labels = 20
+
+    def __init__(self, file: str):
+        """
+        Args:
+            file (str): complete path of the JSON file index is saved in
+        """
+
+        self.file = file
+        self.lock = threading.Lock()
+        self.nodes = []         # [hash, labels, {distance: index of child node}]
+        self.positions = {}     # hash: index of node
+        self.changed = False
+
+        if os.path.exists(file):
+            try:
+                with open(file, 'r') as r:
+                    for dhash, labels, children in json.load(r)["nodes"]:
+                        self.positions[dhash] = len(self.nodes)
+                        self.nodes.append([dhash, labels, { int(distance): child for distance, child in children.items() }])
+            except Exception as e:
+                debug(message=f"Exception while reading avatar index: {file} || {e}", type="exception", separator="\n    [xx] ")
+                self.nodes, self.positions = [], {}
+
+    @staticmethod
+    def distance(hash1: int, hash2: int) -> int:
+        """function to get hamming distance between 2 hashes"""
+        return bin(hash1 ^ hash2).count("1")
+
+    def add(self, dhash: int, label: str) -> None:
+        """function to add a hash with its label to the index
+
+        Args:
+            dhash (int): perceptual hash of the avatar
+            label (str): label of the avatar, like protected:username, candidate:username or impostor:username
+        """
+
+        with self.lock:
+            if dhash in self.positions:
+                labels = self.nodes[self.positions[dhash]][1]
+                if label not in labels and (not label.startswith("candidate:") or sum(1 for l in labels if l.startswith("candidate:")) < self.max_candidate_labels):
+                    labels.append(label)
+                    self.changed = True
+                return
+
+            self.changed = True
+            self.positions[dhash] = len(self.nodes)
+            if not self.nodes:
+                self.nodes.append([dhash, [label], {}])
+                return
+
+            index = 0
+            while True:
+                node = self.nodes[index]
+                distance = self.distance(dhash, node[0])
+                if distance not in node[2]:
+                    node[2][distance] = len(self.nodes)
+                    self.nodes.append([dhash, [label], {}])
+                    return
+                index = node[2][distance]
+
+    def search(self, dhash: int, max_distance: int) -> list:
+        """function to get all known avatars within a hamming distance
+
+        Args:
+            dhash (int): perceptual hash of the avatar
+            max_distance (int): max hamming distance
+
+        Returns:
+            list: (distance, hash, labels) of matching avatars
+        """
+
+        results = []
+        with self.lock:
+            pending = [0] if self.nodes else []
+            while pending:
+                node = self.nodes[pending.pop()]
+                distance = self.distance(dhash, node[0])
+                if distance <= max_distance:
+                    results.append((distance, node[0], list(node[1])))
+
+                # by triangle inequality only these children can be within max_distance
+                pending += [ child for child_distance, child in node[2].items() if distance - max_distance <= child_distance <= distance + max_distance ]
+
+        return sorted(results)
+
+    def save(self) -> None:
+        """function to save index to disk if it has changed"""
+
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                temp_file = f"{self.file}.tmp"
+                with open(temp_file, 'w') as w:
+                    json.dump({"nodes": self.nodes}, w)
+                os.replace(temp_file, self.file)
+                self.changed = False
+            except Exception as e:
+                debug(message=f"Exception while saving avatar index: {self.file} || {e}", type="exception", separator="\n    [xx] ")
+
+
+AVATAR_INDEX = None
+
+
+# >> function to get avatar index, index is loaded on first use
+def get_avatar_index() -> AvatarIndex:
+    """function to get avatar index, index is loaded on first use
+
+    Returns:
+        AvatarIndex: shared avatar index, None if index is disabled in config
+    """
+
+    global AVATAR_INDEX
+    if AVATAR_INDEX is None and CONFIG["avatar_index"]["enabled"]:
+        AVATAR_INDEX = AvatarIndex(os.path.join(OUTPUT_FOLDER, CONFIG["avatar_index"]["file"]))
+    return AVATAR_INDEX
+
+
+# >> function to add avatars of a main profile and its matching profiles to avatar index and find known avatars they look like
+def index_profile_avatars(main_profile_data: dict) -> None:
+    """function to add avatars of a main profile and its matching profiles to avatar index. Every matching profile gets
+        known_avatar_matches, the protected accounts and known impostors whose avatar looks like its avatar.
+
+    Args:
+        main_profile_data (dict): main profile and its matching profiles
+    """
+
+    avatar_index = get_avatar_index()
+    if not avatar_index:
+        return
+
+    main_username = main_profile_data["main_profile"]["username"]
+    main_dhash = get_avatar_dhash(main_profile_data["main_profile"]["avatar_hash"])
+    if main_dhash is not None:
+        avatar_index.add(main_dhash, f"protected:{main_username}")
+
+    for matching_profile in main_profile_data["matching_profiles"]:
+        matching_profile["known_avatar_matches"] = []
+        dhash = get_avatar_dhash(matching_profile["avatar_hash"])
+        if dhash is None:
+            continue
+
+        labels = set()
+        for _, _, match_labels in avatar_index.search(dhash, CONFIG["avatar_index"]["max_distance"]):
+            labels.update(label for label in match_labels if not label.startswith("candidate:"))
+        labels.discard(f"protected:{main_username}")
+        labels.discard(f"protected:{matching_profile['username']}")
+        labels.discard(f"impostor:{matching_profile['username']}")
+
+        matching_profile["known_avatar_matches"] = sorted(labels)
+        avatar_index.add(dhash, f"candidate:{matching_profile['username']}")
+
+
+# >> function to compare structure of 2 avatars
+def compare_avatar_structure(thumbnail1: "numpy.ndarray", thumbnail2: "numpy.ndarray") -> float:
+    """function to compare structure of 2 avatars using structural similarity (SSIM) of their normalized grayscale thumbnails
+
+    Args:
+        thumbnail1 (numpy.ndarray): 64x64 grayscale thumbnail of first avatar
+        thumbnail2 (numpy.ndarray): 64x64 grayscale thumbnail of second avatar
+
+    Returns:
+        float: similarity between -1 and 1, 1 for same image
+    """
+
+    import numpy, cv2
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    image1 = thumbnail1.astype(numpy.float64)
+    image2 = thumbnail2.astype(numpy.float64)
+
+    # local mean, variance and covariance over gaussian window
+    mu1 = cv2.GaussianBlur(image1, (7, 7), 1.5)
+    mu2 = cv2.GaussianBlur(image2, (7, 7), 1.5)
+    sigma1 = cv2.GaussianBlur(image1 * image1, (7, 7), 1.5) - mu1 ** 2
+    sigma2 = cv2.GaussianBlur(image2 * image2, (7, 7), 1.5) - mu2 ** 2
+    sigma12 = cv2.GaussianBlur(image1 * image2, (7, 7), 1.5) - mu1 * mu2
+
+    ssim_map = ((2 * mu1 * mu2 + c1) * (2 * sigma12 + c2)) / ((mu1 ** 2 + mu2 ** 2 + c1) * (sigma1 + sigma2 + c2))
+    return float(ssim_map.mean())
+
+
+# >> function to run structural comparison on shortlist of matching profiles
+def check_avatar_structure(main_profile_data: dict) -> None:
+    """function to run structural comparison of avatars on top matching profiles of a main profile, after they are scored on histogram distance.
+        Size of shortlist and time that can be spent on it are set by structural_check in config.
+
+    Args:
+        main_profile_data (dict): main profile and its scored matching profiles
+    """
+
+    if not CONFIG["structural_check"]["enabled"]:
+        return
+
+    started = time.perf_counter()
+    original_avatar_hash = main_profile_data["main_profile"]["avatar_hash"]
+    original_features = get_avatar_features(original_avatar_hash)
+    if not original_features or "thumbnail" not in original_features:
+        return
+
+    candidates = [ matching_profile for matching_profile in main_profile_data["matching_profiles"] if matching_profile["avatar_hash"] ]
+    for matching_profile in heapq.nsmallest(CONFIG["structural_check"]["shortlist_size"], candidates, key=get_ranking_key):
+        if time.perf_counter() - started > CONFIG["structural_check"]["time_budget"]:
+            break
+
+        if matching_profile["avatar_hash"] == original_avatar_hash:
+            matching_profile["avatar_structure_similarity"] = 1.0
+            continue
+
+        features = get_avatar_features(matching_profile["avatar_hash"])
+        if features and "thumbnail" in features:
+            matching_profile["avatar_structure_similarity"] = compare_avatar_structure(original_features["thumbnail"], features["thumbnail"])
+
+
+# >> function to compare 2 strings
+def compare_string(str1: str, str2: str) -> float:
+    """function to compare 2 strings by using fuzzy logic
+
+    Args:
+        str1 (str): first string 
+        str2 (str): second string
+
+    Returns:
+        float: score of the comparison
+    """
+    from fuzzywuzzy import fuzz
+
+    try:
+        if str1 and str2:
+            ratio = fuzz.ratio(str1, str2)
+        else: ratio = 0
+    except Exception as e:
+        debug(message=f"Got exception while comparing strings. || {e}", type="exception", separator="\n    [xx] ")
+        ratio = 0
+    
+    return ratio
+
+
+# >> function to compare many strings with many strings in one go
+def compare_strings_batch(main_strings: list, matching_strings: list) -> "numpy.ndarray":
+    """function to compare many strings with many strings by using fuzzy logic in a single cross distance call.
+        Scores are same as compare_string, rounded 0-100 and 0 when either string is empty.
+
+    Args:
+        main_strings (list): strings of main profiles
+        matching_strings (list): strings of the profiles searched
+
+    Returns:
+        numpy.ndarray: (len(main_strings) x len(matching_strings)) matrix of scores
+    """
+
+    import numpy, rapidfuzz.fuzz, rapidfuzz.process
+
+    # strings are normalized once and reused for every pair
+    main_strings = [ str(string or "") for string in main_strings ]
+    matching_strings = [ str(string or "") for string in matching_strings ]
+    if not (main_strings and matching_strings):
+        return numpy.zeros((len(main_strings), len(matching_strings)), dtype=int)
+
+    with METRICS.timer("fuzzy_match_seconds"):
+        scores = rapidfuzz.process.cdist(main_strings, matching_strings, scorer=rapidfuzz.fuzz.ratio, processor=None, dtype=numpy.float64)
+    scores = numpy.rint(scores).astype(int)
+
+    # empty strings do not match anything
+    scores[[ not string for string in main_strings ], :] = 0
+    scores[:, [ not string for string in matching_strings ]] = 0
+    return scores
+
+
+# function to compare avatar, bio and name of 2 profiles and give scores
+def compare_profiles(original_profile: dict, matching_profile: dict, avatar_similarity: float=None, name_similarity: int=None, bio_similarity: int=None) -> dict:
+    """function to compare avatar, bio and name of 2 profiles and give scores
+
+    Args:
+        original_profile (dict): original profile
+        matching_profile (dict): profile that is to be compared
+        avatar_similarity (float, optional): avatar distance already calculated by compare_avatars_batch. Defaults to None.
+        name_similarity (int, optional): name score already calculated by compare_strings_batch. Defaults to None.
+        bio_similarity (int, optional): bio score already calculated by compare_strings_batch. Defaults to None.
+
+    Returns:
+        dict: updated matching profile with score
+    """
+
+    if avatar_similarity is None:
+        avatar_similarity = compare_avatar(original_profile['avatar_file'], matching_profile['avatar_file'])
+    if name_similarity is None:
+        name_similarity = compare_string(original_profile['fullname'], matching_profile['fullname'])
+    if bio_similarity is None:
+        bio_similarity = compare_string(original_profile['bio'], matching_profile['bio'])
+    matching_profile["avatar_similarity"] = avatar_similarity      # compare image
+    matching_profile["name_similarity"] = name_similarity        # compare name
+    matching_profile["bio_similarity"] = bio_similarity       # compare bio
+
+    # calculating score
+    matching_profile["comparison_score"] = get_comparison_score(matching_profile["avatar_similarity"], matching_profile["name_similarity"], matching_profile["bio_similarity"])
+    return matching_profile
+
+
+# >> function to calculate comparison score from avatar, name and bio scores
+def get_comparison_score(avatar_similarity: float, name_similarity: int, bio_similarity: int) -> int:
+    """function to calculate comparison score from avatar, name and bio scores using weightage and min_similarity from config
+
+    Args:
+        avatar_similarity (float): avatar distance, float("inf") to leave avatar out of the score
+        name_similarity (int): name score
+        bio_similarity (int): bio score
+
+    Returns:
+        int: comparison score
+    """
+
+    avatar_similarity = 1 if avatar_similarity <= CONFIG["min_similarity"]["avatar"] else 0
+    name_similarity = 1 if name_similarity >= CONFIG["min_similarity"]["name"] else 0
+    bio_similarity = 1 if bio_similarity >= CONFIG["min_similarity"]["bio"] else 0
+    return (avatar_similarity * CONFIG["weightage"]["avatar"]) + (name_similarity * CONFIG["weightage"]["name"]) + (bio_similarity * CONFIG["weightage"]["bio"])
+
+
+# >> function to get key on which matching profiles are ranked
+def get_ranking_key(matching_profile: dict) -> tuple:
+    """function to get key on which matching profiles are ranked, smaller key is closer match.
+        Profiles are ranked on comparison score, then on structural similarity of avatar when it is checked and then on avatar distance.
+
+    Args:
+        matching_profile (dict): scored matching profile
+
+    Returns:
+        tuple: ranking key
+    """
+
+    avatar_structure_similarity = matching_profile.get("avatar_structure_similarity")
+    return (
+        -matching_profile["comparison_score"],
+        -(avatar_structure_similarity if avatar_structure_similarity is not None else -1),
+        matching_profile["avatar_similarity"]
+    )
+
+
+# >> function that takes list of matching profiles and returns top k profiles
+def get_top_matching_profiles(matching_profiles: list, k: int=1) -> list:
+    """function that takes list of matching profiles and returns top k profiles using heap based partial selection, so list is never fully sorted.
+        Profiles with same score are ranked on avatar, see get_ranking_key.
+
+    Args:
+        matching_profiles (list): list of matching profiles
+        k (int, optional): number of profiles required. Defaults to 1.
+
+    Returns:
+        list: top k profiles, closest first
+    """
+
+    return heapq.nsmallest(k, matching_profiles, key=get_ranking_key)
+
+
+# >> function that takes list of matching profiles and returns profile with max score.
+def get_closest_matching_profile(matching_profiles: list) -> dict:
+    """function that takes list of matching profiles and returns profile with max score.
+        If two dict have same score, then one with closest avatar is selected.
+
+    Args:
+        matching_profiles (list): lis of matching profiles
+
+    Returns:
+        dict: profile with max score
+    """
+    try:
+        return get_top_matching_profiles(matching_profiles, 1)[0]
+    except Exception as e:
+        debug(message=f"Exception while getting closest match || {e}", type="exception", separator="\n     [>>] ")
+        return {
+            "username": f"Exception while getting closest match || {e}",
+            "comparison_score": 0
+        }
+
+
+# >> writer that appends result rows to output file as soon as they are selected
+class ResultSink:
+    """writer that appends result rows to output file as soon as each main profile is selected, so memory stays flat and
+        partial results can be read while a long scan is running. Rows are written as csv, jsonl or parquet.
+    """
+
+    # extension of output file of every format
+    extensions = { "csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet" }
+
+    def __init__(self, file: str, format: str="csv", flush_rows: int=10, flush_seconds: float=2.0):
+        """
+        Args:
+            file (str): complete path of output file, extension is replaced by that of format
+            format (str, optional): csv, jsonl or parquet. Defaults to "csv".
+            flush_rows (int, optional): rows written before file is flushed. Defaults to 10.
+            flush_seconds (float, optional): seconds after which pending rows are flushed, even when no new row comes in. Defaults to 2.0.
+
+        Raises:
+            ImportError: format is parquet and pyarrow is not installed
+        """
+
+        if format == "parquet":
+            try:
+                import pyarrow, pyarrow.parquet
+            except ImportError as e:
+                raise ImportError(f"output format parquet needs pyarrow, install it with 'pip install pyarrow' or set output.format to csv or jsonl in config || {e}") from e
+
+        self.format = format
+        self.file = os.path.splitext(file)[0] + self.extensions[format]
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.handle = None
+        self.writer = None
+
+        path = os.path.dirname(self.file)
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+        if format != "parquet":
+            self.handle = open(self.file, 'w', newline='', encoding='utf-8')
+
+        # pending rows are flushed in background, so a slow scan does not keep them off disk till next row comes in
+        self.stopped = threading.Event()
+        if flush_seconds:
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _flush_periodically(self) -> None:
+        while not self.stopped.wait(self.flush_seconds):
+            with self.lock:
+                if self.pending and time.monotonic() - self.last_flush >= self.flush_seconds:
+                    self._flush()
+
+    def write(self, rows: list) -> None:
+        """function to append rows of a main profile
+
+        Args:
+            rows (list): rows of output file
+        """
+
+        with self.lock:
+            self.pending.extend(rows)
+            self.rows += len(rows)
+            if len(self.pending) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self.pending:
+            if self.format == "csv":
+                if self.writer is None:
+                    # columns are taken from first row, later rows of same run have same columns
+                    self.writer = csv.DictWriter(self.handle, fieldnames=list(self.pending[0]), restval="", extrasaction="ignore")
+                    self.writer.writeheader()
+                self.writer.writerows(self.pending)
+            elif self.format == "jsonl":
+                self.handle.write("".join(json.dumps(row, default=str) + "\n" for row in self.pending))
+            else:
+                import pyarrow, pyarrow.parquet
+
+                # every flush becomes a row group, so only pending rows are held in memory
+                if self.writer is None:
+                    table = pyarrow.Table.from_pylist(self.pending)
+                    self.writer = pyarrow.parquet.ParquetWriter(self.file, table.schema)
+                else:
+                    table = pyarrow.Table.from_pylist(self.pending, schema=self.writer.schema)
+                self.writer.write_table(table)
+            self.pending = []
+
+        if self.handle:
+            self.handle.flush()
+        self.last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        """function to write pending rows to disk"""
+        with self.lock:
+            self._flush()
+
+    def close(self) -> None:
+        """function to write pending rows and close output file"""
+        self.stopped.set()
+        with self.lock:
+            self._flush()
+            if self.handle:
+                os.fsync(self.handle.fileno())
+                self.handle.close()
+                self.handle = None
+            elif self.writer:
+                self.writer.close()
+            self.writer = None
+
+
+# >> function to open result sink for output file as set in config
+def open_result_sink(file_name: str) -> ResultSink:
+    """function to open result sink for output file in CSVs folder, in format set in config
+
+    Args:
+        file_name (str): name of output file
+
+    Returns:
+        ResultSink: opened result sink
+    """
+
+    return ResultSink(
+        os.path.join(OUTPUT_FOLDER, "CSVs", file_name),
+        format=CONFIG["output"]["format"],
+        flush_rows=CONFIG["output"]["flush_rows"],
+        flush_seconds=CONFIG["output"]["flush_seconds"]
+    )
+
+
+# >> save_json
+def save_json(json_data: dict, file: str) -> None:
+    try:
+        # creating path for output file
+        path = os.path.join(OUTPUT_FOLDER, "JSONs")
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        file = os.path.join(path, file)
+        with open(file, 'w') as w:
+            json.dump(json_data, w, indent=4)
+    except Exception as e:
+        debug(message=f"Exception while saving data to JSON file: {file} || {e}", type="exception", separator="\n    [xx] ")
+
+
+# >> data of main profiles in the pipeline, keyed by username of main profile
+PROFILE_STORE = {}
+
+
+# >> function to keep data of main profile in memory between pipeline stages
+def put_profile_data(main_profile: str, main_profile_data: dict) -> None:
+    """function to keep data of main profile in memory between pipeline stages. Data is written to disk only when save_json is set in config
+
+    Args:
+        main_profile (str): username of the main_account
+        main_profile_data (dict): main profile and its matching profiles
+    """
+
+    PROFILE_STORE[main_profile] = main_profile_data
+    if CONFIG["save_json"]:
+        save_json(main_profile_data, f"{main_profile}.json")
+
+
+# >> function to get data of main profile kept in memory
+def get_profile_data(main_profile: str) -> dict:
+    """function to get data of main profile kept in memory
+
+    Args:
+        main_profile (str): username of the main_account
+
+    Returns:
+        dict: main profile and its matching profiles, empty dict if not found
+    """
+
+    return PROFILE_STORE.get(main_profile) or {}
+
+
+# >> function to remove data of main profile from memory once it is done
+def drop_profile_data(main_profile: str) -> None:
+    """function to remove data of main profile from memory once it is done
+
+    Args:
+        main_profile (str): username of the main_account
+    """
+
+    PROFILE_STORE.pop(main_profile, None)
+
+
+# >> function to get user profile and get its matching profile. Function is intended to run as concurrent task on http engine.
+async def get_profile_data_thread(main_profile):
+
+    """function to get user profile and get its matching profile. Function is intended to run as concurrent task on http engine.
+
+    Args:
+        main_profile (str): username of the main_account
+
+    Returns:
+        bool: True if data of main profile is saved
+    """
+    debug(message=f"User: {main_profile} || Getting User Info and Matching profiles.", type="info", separator=f"\n    [>] ")
+    try:
+        # get user info
+        user_profile = await make_request(CONFIG['rapid_api']['user_info_url'], {"unique_id":f"@{main_profile}"}, on_rejected=lambda: UNKNOWN_PROFILES.add(main_profile))
+        if not user_profile:
+            debug(message=f"Could not get user info for {main_profile}", type="error", separator="\n    [xx] ")
+            return
+
+        user = get_user_detail(user_profile["data"])
+        if not user:
+            UNKNOWN_PROFILES.add(main_profile)
+            debug(message=f"Could not get user detail for {main_profile}", type="error", separator="\n    [xx] ")
+            return
+
+        # get profiles with matching name
+        matching_profiles = []
+        if user['fullname']:
+            matching_profiles += await get_matching_profiles(user['fullname'], count=30)
+
+        # get profiles with matching username
+        if main_profile:
+            matching_profiles += await get_matching_profiles(main_profile, count=30)
+        
+        matching_profiles = sanitize_matching_profiles(matching_profiles, main_profile)
+
+        final_data = {
+            "main_profile": user,
+            "matching_profiles": matching_profiles
+        }
+
+        put_profile_data(main_profile, final_data)
+        return True
+    except Exception as e:
+        debug(message=f"Exception while getting matching profiles for user: {main_profile} || {e}", type="exception", separator="\n    [xx] ")
+    return False
+
+
+# >> main profiles api does not know, retrying them can not help
+UNKNOWN_PROFILES = set()
+
+
+# >> avatar downloads made in current run, keyed by canonical url, and counts of avatars not downloaded or saved again
+AVATAR_DOWNLOADS = {}
+AVATAR_STORE_STATS = {"downloaded": 0, "url_duplicates": 0, "content_duplicates": 0, "lazy_skipped": 0}
+
+
+# >> function to get canonical form of avatar url
+def get_canonical_avatar_url(avatar_url: str) -> str:
+    """function to get canonical form of avatar url. Same image is served with a different signature in every response,
+        so query of the url is dropped and scheme and host are lowercased. Path is kept as it is, as it is case sensitive.
+
+    Args:
+        avatar_url (str): url of the avatar
+
+    Returns:
+        str: canonical url
+    """
+
+    url = urllib.parse.urlsplit(avatar_url.strip())
+    return urllib.parse.urlunsplit((url.scheme.lower(), url.netloc.lower(), url.path, "", ""))
+
+
+# >> function to download avatars. Function is intended to run as concurrent task on http engine.
+async def download_avatar_thread(avatar_url: str) -> str:
+    """function to download avatars. Function is intended to run as concurrent task on http engine.
+        An url is downloaded only once in a run, concurrent and later calls for it share the first download. A download that fails
+        is not kept, so later calls download again.
+
+    Args:
+        avatar_url (str): url from here image is to be downloaded
+
+    Returns:
+        str: hash of the image, empty string if image could not be downloaded
+    """
+
+    if not avatar_url:
+        return ""
+
+    canonical_url = get_canonical_avatar_url(avatar_url)
+    if canonical_url not in AVATAR_DOWNLOADS:
+        AVATAR_DOWNLOADS[canonical_url] = asyncio.ensure_future(store_avatar(avatar_url))
+    else:
+        AVATAR_STORE_STATS["url_duplicates"] += 1
+
+    avatar_download = AVATAR_DOWNLOADS[canonical_url]
+    avatar_hash = ""
+    try:
+        avatar_hash = await avatar_download
+    finally:
+        # failed download is not kept, so next profile with same avatar downloads it again
+        if not avatar_hash and AVATAR_DOWNLOADS.get(canonical_url) is avatar_download:
+            del AVATAR_DOWNLOADS[canonical_url]
+    return avatar_hash
+
+
+# >> function to download an avatar and save it in content addressed avatar store
+async def store_avatar(avatar_url: str) -> str:
+    """function to download an avatar and decode its features straight from the downloaded bytes.
+        Image is saved in avatar store as {hash}.jpeg only when archive_avatars is set in config, and is not written again if same content is already saved.
+
+    Args:
+        avatar_url (str): url from here image is to be downloaded
+
+    Returns:
+        str: hash of the image, empty string if image could not be downloaded
+    """
+
+    try:
+        with METRICS.timer("avatar_download_seconds"):
+            status, _, content = await get_http_engine().get(avatar_url)
+        if status != 200 or not content:
+            METRICS.increment("avatar_failures_total", status=status)
+            return ""
+        AVATAR_STORE_STATS["downloaded"] += 1
+        METRICS.increment("bytes_downloaded_total", len(content), kind="avatar")
+
+        avatar_hash = hashlib.sha1(content).hexdigest()
+        if get_avatar_features(avatar_hash) is None:
+            # decoding in a worker thread so that event loop is not blocked
+            await asyncio.get_running_loop().run_in_executor(None, get_avatar_features, avatar_hash, content)
+        else:
+            AVATAR_STORE_STATS["content_duplicates"] += 1
+
+        avatar_file = os.path.join(AVATAR_FOLDER, f"{avatar_hash}.jpeg")
+        if not CONFIG["archive_avatars"] or os.path.exists(avatar_file):
+            return avatar_hash
+
+        # Save the image in the local folder
+        temp_file = f"{avatar_file}.tmp"
+        with open(temp_file, "wb") as f:
+            f.write(content)
+        os.replace(temp_file, avatar_file)
+        return avatar_hash
+    except Exception as e:
+        # debug(message=f"Exception wile downloading Image || {e}", type="exception", separator="\n    [xx] ")
+        METRICS.increment("avatar_failures_total", status="exception")
+        return ""
+
+
+# >> function to calculate comparison score between each matching profiles and main profile
+def score_profile_data(main_profile_data: dict) -> dict:
+    """function to calculate comparison score between each matching profiles and main profile
 
-    time_ended = datetime.datetime.now()
-    total_execution_time = time_ended - time_started
-    debug(message=f"Total Execution Time to get data from TikT  ok: {total_execution_time}", type="info", separator=f"\n [+] ")
+    Args:
+        main_profile_data (dict): main profile and its matching profiles
 
+    Returns:
+        dict: main profile and its matching profiles with scores
+    """
 
-    # ! LOOP THROUGH ALL PROFILES, READ MATCHING PROFILE JSON AND DOWNLOAD IMAGE 
-    debug(message=f"Collecting all avatar URLs for downloading", type="info", separator=f"\n [+] ")
-    avatars = []
-    for main_profile in main_profiles:
-        # read profile json file
-        main_profile_data = read_json(f"{main_profile}.json")
+    if not main_profile_data or "matching_profiles" not in main_profile_data:
+        return main_profile_data
 
-        if main_profile_data:
-            avatars.append((main_profile_data["main_profile"]["avatar_url"], main_profile_data["main_profile"]["avatar_file"]))
-            avatars += [ (data["avatar_url"], data["avatar_file"]) for data in main_profile_data["matching_profiles"] ]
+    main_profile = main_profile_data["main_profile"]
 
-    debug(message=f"Downloading Avatars", type="info", separator=f"\n [+] ")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG["max_worker_count"]) as download_thread:
-        # download_thread.map(download_avatar_thread_2, *zip(*avatars))
-        download_thread.map(download_avatar_thread, *zip(*avatars))
-    debug(message=f"Done Downloading Avatars", type="info", separator=f"\n [+] ")
+    # profiles unchanged since last delta scan keep their scores, only comparison score is worked out again as config may have changed
+    matching_profiles = []
+    for matching_profile in main_profile_data["matching_profiles"]:
+        if matching_profile.get("delta_reused"):
+            matching_profile["comparison_score"] = get_comparison_score(matching_profile["avatar_similarity"], matching_profile["name_similarity"], matching_profile["bio_similarity"])
+        else:
+            matching_profiles.append(matching_profile)
 
+    # get avatar distance, name score and bio score of all matching profiles in one go, scores worked out by lazy avatar download are reused
+    set_avatar_similarities(main_profile, [ matching_profile for matching_profile in matching_profiles if "avatar_similarity" not in matching_profile ])
+    set_text_similarities(main_profile, [ matching_profile for matching_profile in matching_profiles if "name_similarity" not in matching_profile ])
 
-    # ! LOOP THROUGH ALL PROFILES, READ MATCHING PROFILE JSON AND CALCULATE COMPARISON SCORE 
-    debug(message=f"Starting Profile Comparisons", type="info", separator=f"\n [+] ")
-    with concurrent.futures.ThreadPoolExecutor() as profile_comparison_thread:
-        profile_comparison_thread.map(profile_comparison, main_profiles)
-    debug(message=f"Done Profile Comparisons", type="info", separator=f"\n [+] ")
+    # get comparison score
+    for matching_profile in matching_profiles:
+        compare_profiles(main_profile, matching_profile, matching_profile["avatar_similarity"], matching_profile["name_similarity"], matching_profile["bio_similarity"])
 
+    # structural comparison only on the profiles that can be picked
+    check_avatar_structure(main_profile_data)
+    return main_profile_data
 
-    # ! GET CLOSEST MATCHING PROFILE FOR EACH PROFILE AND GENERATE CSV 
-    debug(message=f"Starting to get closest match", type="info", separator=f"\n [+] ")
-    closest_matching_profiles = []
 
-    # looping through list of usernames
-    for i, main_profile in enumerate(main_profiles, start=1):
-        main_profile_data = read_json(f"{main_profile}.json")
-        if not 'matching_profiles' in main_profile_data:
+# >> function to save name and bio scores on matching profiles
+def set_text_similarities(original_profile: dict, matching_profiles: list) -> None:
+    """function to compare name and bio of main profile with those of all matching profiles in one go and save scores on matching profiles
+
+    Args:
+        original_profile (dict): main profile
+        matching_profiles (list): matching profiles to be compared
+    """
+
+    if not matching_profiles:
+        return
+
+    name_similarities = compare_strings_batch([ original_profile["fullname"] ], [ matching_profile["fullname"] for matching_profile in matching_profiles ])[0].tolist()
+    bio_similarities = compare_strings_batch([ original_profile["bio"] ], [ matching_profile["bio"] for matching_profile in matching_profiles ])[0].tolist()
+    for matching_profile, name_similarity, bio_similarity in zip(matching_profiles, name_similarities, bio_similarities):
+        matching_profile["name_similarity"] = name_similarity
+        matching_profile["bio_similarity"] = bio_similarity
+
+
+# >> function to save avatar distances on matching profiles
+def set_avatar_similarities(original_profile: dict, matching_profiles: list) -> None:
+    """function to compare avatar of main profile with avatars of all matching profiles in one go and save distances on matching profiles
+
+    Args:
+        original_profile (dict): main profile
+        matching_profiles (list): matching profiles to be compared
+    """
+
+    if not matching_profiles:
+        return
+
+    avatar_similarities = compare_avatars_batch(original_profile["avatar_hash"], [ matching_profile["avatar_hash"] for matching_profile in matching_profiles ])
+    for matching_profile, avatar_similarity in zip(matching_profiles, avatar_similarities):
+        matching_profile["avatar_similarity"] = avatar_similarity
+
+
+# >> function to score a batch of main profiles. Function is intended to run in worker processes or threads.
+def score_profiles_batch(batch: list) -> list:
+    """function to score a batch of main profiles. Function is intended to run in worker processes or threads.
+
+    Args:
+        batch (list): data of main profiles, each with its matching profiles
+
+    Returns:
+        list: data of main profiles with scores
+    """
+
+    return [ score_profile_data(main_profile_data) for main_profile_data in batch ]
+
+
+# >> function to score a batch of main profiles in executor and send metrics of worker process back with results
+def score_profiles_in_worker(batch: list) -> tuple:
+    """function to score a batch of main profiles in scoring executor. Worker processes have their own metrics,
+        so metrics recorded while scoring are sent back with results to be merged in main process.
+
+    Args:
+        batch (list): data of main profiles, each with its matching profiles
+
+    Returns:
+        tuple: data of main profiles with scores, and snapshot of metrics (None when running in main process)
+    """
+
+    batch = score_profiles_batch(batch)
+    if multiprocessing.parent_process() is None:
+        return batch, None
+    return batch, METRICS.snapshot(reset=True)
+
+
+# >> function to set up globals of a scoring worker process
+def init_scoring_worker(config: dict, base_folder: str, output_folder: str, avatar_folder: str) -> None:
+    """function to set up globals of a scoring worker process, as worker does not run code under __main__
+
+    Args:
+        config (dict): config of the script
+        base_folder (str): path of the project folder
+        output_folder (str): path of the DATA folder
+        avatar_folder (str): path of the avatar folder
+    """
+
+    global CONFIG, BASE_FOLDER, OUTPUT_FOLDER, AVATAR_FOLDER, logger
+    CONFIG = config
+    BASE_FOLDER = base_folder
+    OUTPUT_FOLDER = output_folder
+    AVATAR_FOLDER = avatar_folder
+    logger = logging.getLogger(__name__)
+
+
+SCORE_EXECUTOR = None
+
+
+# >> function to get executor that scores main profiles, executor is started on first use
+def get_score_executor() -> concurrent.futures.Executor:
+    """function to get executor that scores main profiles, executor is started on first use.
+        Process pool is used when scoring.backend is process in config, else thread pool.
+
+    Returns:
+        concurrent.futures.Executor: shared scoring executor
+    """
+
+    global SCORE_EXECUTOR
+    if SCORE_EXECUTOR is None:
+        if CONFIG["scoring"]["backend"] == "process":
+            SCORE_EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+                max_workers=CONFIG["pipeline"]["score_workers"],
+                initializer=init_scoring_worker,
+                initargs=(CONFIG, BASE_FOLDER, OUTPUT_FOLDER, AVATAR_FOLDER)
+            )
+        else:
+            SCORE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG["pipeline"]["score_workers"])
+    return SCORE_EXECUTOR
+
+
+# >> function to throw away scoring executor, so that a new one is started on next use
+def reset_score_executor() -> None:
+    """function to throw away scoring executor, so that a new one is started on next use. Process pool can not be used again
+        once one of its workers has died.
+    """
+
+    global SCORE_EXECUTOR
+    executor, SCORE_EXECUTOR = SCORE_EXECUTOR, None
+    if executor:
+        executor.shutdown(wait=False)
+
+
+# >> function to download avatars of main profile and all its matching profiles
+async def download_profile_avatars(main_profile: str) -> str:
+    """function to download avatars of main profile and its matching profiles concurrently.
+        When lazy_avatar_download is set in config, only avatars that can still change the top_k closest matching profiles or their Status are downloaded.
+
+    Args:
+        main_profile (str): username of the main_account
+
+    Returns:
+        str: username of the main_account, None if data of main profile is not found
+    """
+
+    main_profile_data = get_profile_data(main_profile)
+    if not main_profile_data:
+        return None
+
+    original_profile = main_profile_data["main_profile"]
+    if not original_profile.get("delta_reused"):
+        await download_avatars([ original_profile ])
+
+    # profiles unchanged since last delta scan already have their avatar scored
+    matching_profiles = [ matching_profile for matching_profile in main_profile_data["matching_profiles"] if not matching_profile.get("delta_reused") ]
+    reused_scores = [
+        get_comparison_score(matching_profile["avatar_similarity"], matching_profile["name_similarity"], matching_profile["bio_similarity"])
+        for matching_profile in main_profile_data["matching_profiles"] if matching_profile.get("delta_reused")
+    ]
+
+    if not CONFIG["lazy_avatar_download"]:
+        await download_avatars(matching_profiles)
+        return main_profile
+
+    # no avatar of main profile to compare with, so no avatar can change the score
+    if not original_profile["avatar_hash"]:
+        skip_avatars(matching_profiles)
+        return main_profile
+
+    # score on name and bio first, avatar can add at most its weightage to it
+    # comparisons run off the event loop, so that fetches and downloads in flight are not held up, and are kept on profiles for score stage
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, set_text_similarities, original_profile, matching_profiles)
+    text_scores = [ get_comparison_score(float("inf"), matching_profile["name_similarity"], matching_profile["bio_similarity"]) for matching_profile in matching_profiles ]
+
+    groups = {}
+    for matching_profile, text_score in zip(matching_profiles, text_scores):
+        groups.setdefault(text_score, []).append(matching_profile)
+
+    # going from highest possible score down, a group whose best possible score is below k-th best score found so far can not be picked in top_k
+    # profiles with score equal to k-th best score are still downloaded as ties are broken on avatar_similarity
+    top_k = max(1, CONFIG["top_k"])
+    top_scores = heapq.nlargest(top_k, reused_scores)
+    heapq.heapify(top_scores)
+    for text_score in sorted(groups, reverse=True):
+        group = groups[text_score]
+        if len(top_scores) == top_k and text_score + CONFIG["weightage"]["avatar"] < top_scores[0]:
+            skip_avatars(group)
             continue
-        closest_profile = get_closest_matching_profile(main_profile_data["matching_profiles"])
 
-        # adding closest matching profile to desired profiles list
-        closest_matching_profiles.append({
+        await download_avatars(group)
+        await loop.run_in_executor(None, set_avatar_similarities, original_profile, group)
+        for matching_profile in group:
+            avatar_similarity = matching_profile["avatar_similarity"]
+            score = text_score + (CONFIG["weightage"]["avatar"] if avatar_similarity <= CONFIG["min_similarity"]["avatar"] else 0)
+            if len(top_scores) < top_k:
+                heapq.heappush(top_scores, score)
+            elif score > top_scores[0]:
+                heapq.heapreplace(top_scores, score)
+
+    return main_profile
+
+
+# >> function to download avatars of profiles concurrently
+async def download_avatars(profiles: list) -> None:
+    """function to download avatars of profiles concurrently and save hash of each avatar on its profile
+
+    Args:
+        profiles (list): profiles whose avatars are to be downloaded
+    """
+
+    avatar_hashes = await asyncio.gather(*[ download_avatar_thread(profile["avatar_url"]) for profile in profiles ])
+    for profile, avatar_hash in zip(profiles, avatar_hashes):
+        profile["avatar_hash"] = avatar_hash
+        profile["avatar_file"] = f"{avatar_hash}.jpeg" if avatar_hash else ""
+
+
+# >> function to mark avatars of profiles as not downloaded
+def skip_avatars(profiles: list) -> None:
+    """function to mark avatars of profiles as not downloaded, as they can not change the top_k closest matching profiles
+
+    Args:
+        profiles (list): profiles whose avatars are skipped
+    """
+
+    for profile in profiles:
+        profile["avatar_skipped"] = True
+    AVATAR_STORE_STATS["lazy_skipped"] += len(profiles)
+
+
+# >> on disk state of last scan of every main profile, used by delta scan
+class DeltaStore:
+    """sqlite backed state of last scan of every main profile. It keeps fingerprint of main profile and its matching profiles with their scores,
+        so that next scan scores only new or changed matching profiles.
+    """
+
+    def __init__(self, file: str):
+        """
+        Args:
+            file (str): complete path of the sqlite file
+        """
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS main_profiles (main_profile TEXT PRIMARY KEY, fingerprint TEXT, avatar_hash TEXT, scanned_at REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS matching_profiles (main_profile TEXT, username TEXT, fingerprint TEXT, data TEXT, PRIMARY KEY (main_profile, username))")
+        self.connection.commit()
+
+    def load(self, main_profile: str) -> tuple:
+        """function to load state of last scan of a main profile
+
+        Args:
+            main_profile (str): username of the main_account
+
+        Returns:
+            tuple: fingerprint and avatar hash of main profile, and {username: (fingerprint, data)} of its matching profiles. (None, None, {}) if never scanned
+        """
+
+        with self.lock:
+            row = self.connection.execute("SELECT fingerprint, avatar_hash FROM main_profiles WHERE main_profile = ?", (main_profile,)).fetchone()
+            if not row:
+                return None, None, {}
+
+            matching_profiles = {
+                username: (fingerprint, json.loads(data))
+                for username, fingerprint, data in self.connection.execute("SELECT username, fingerprint, data FROM matching_profiles WHERE main_profile = ?", (main_profile,))
+            }
+            return row[0], row[1], matching_profiles
+
+    def save(self, main_profile: str, main_profile_data: dict) -> None:
+        """function to save state of current scan of a main profile, replacing state of last scan
+
+        Args:
+            main_profile (str): username of the main_account
+            main_profile_data (dict): main profile and its scored matching profiles
+        """
+
+        original_profile = main_profile_data["main_profile"]
+        with self.lock:
+            self.connection.execute("DELETE FROM matching_profiles WHERE main_profile = ?", (main_profile,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO main_profiles (main_profile, fingerprint, avatar_hash, scanned_at) VALUES (?, ?, ?, ?)",
+                (main_profile, get_profile_fingerprint(original_profile), original_profile["avatar_hash"], time.time())
+            )
+
+            # profiles whose avatar was not downloaded have no avatar score to reuse
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO matching_profiles (main_profile, username, fingerprint, data) VALUES (?, ?, ?, ?)",
+                [
+                    (main_profile, matching_profile["username"], get_profile_fingerprint(matching_profile), json.dumps({ key: matching_profile.get(key) for key in DELTA_FIELDS }))
+                    for matching_profile in main_profile_data["matching_profiles"] if not matching_profile.get("avatar_skipped")
+                ]
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        """function to close the sqlite file"""
+        with self.lock:
+            self.connection.close()
+
+
+# >> fields of a matching profile that are carried over from last scan
+# structural similarity is not carried over, as it is only set on shortlist of a scan and check_avatar_structure works it out again
+DELTA_FIELDS = ("avatar_hash", "avatar_file", "avatar_similarity", "name_similarity", "bio_similarity", "known_avatar_matches")
+DELTA_STORE = None
+
+
+# >> function to get fingerprint of the fields of a profile that scores depend on
+def get_profile_fingerprint(profile: dict) -> str:
+    """function to get fingerprint of the fields of a profile that scores depend on
+
+    Args:
+        profile (dict): profile
+
+    Returns:
+        str: fingerprint
+    """
+
+    return hashlib.sha1(json.dumps([ profile["fullname"], profile["bio"], get_canonical_avatar_url(profile["avatar_url"] or "") ]).encode("utf-8")).hexdigest()
+
+
+# >> function to get delta store, store is opened on first use
+def get_delta_store() -> DeltaStore:
+    """function to get delta store, store is opened on first use
+
+    Returns:
+        DeltaStore: shared delta store, None if delta scan is disabled in config
+    """
+
+    global DELTA_STORE
+    if DELTA_STORE is None and CONFIG["delta_scan"]["enabled"]:
+        if not os.path.exists(OUTPUT_FOLDER):
+            os.makedirs(OUTPUT_FOLDER)
+        DELTA_STORE = DeltaStore(os.path.join(OUTPUT_FOLDER, CONFIG["delta_scan"]["file"]))
+    return DELTA_STORE
+
+
+# >> function to carry over scores of matching profiles that have not changed since last scan
+def apply_delta_state(main_profile: str) -> None:
+    """function to carry over scores of matching profiles that have not changed since last scan. Such profiles are marked delta_reused
+        and are not downloaded or scored again. Nothing is carried over if main profile itself has changed.
+
+    Args:
+        main_profile (str): username of the main_account
+    """
+
+    delta_store = get_delta_store()
+    main_profile_data = get_profile_data(main_profile)
+    if not (delta_store and main_profile_data):
+        return
+
+    main_fingerprint, main_avatar_hash, saved_profiles = delta_store.load(main_profile)
+    original_profile = main_profile_data["main_profile"]
+    if main_fingerprint != get_profile_fingerprint(original_profile) or not get_avatar_features(main_avatar_hash):
+        return
+
+    original_profile["avatar_hash"] = main_avatar_hash
+    original_profile["avatar_file"] = f"{main_avatar_hash}.jpeg"
+    original_profile["delta_reused"] = True
+
+    reused = 0
+    for matching_profile in main_profile_data["matching_profiles"]:
+        fingerprint, data = saved_profiles.get(matching_profile["username"], (None, None))
+        if fingerprint == get_profile_fingerprint(matching_profile):
+            # state saved by older versions may still have structural similarity of last shortlist
+            matching_profile.update({ key: value for key, value in data.items() if key in DELTA_FIELDS })
+            matching_profile["delta_reused"] = True
+            reused += 1
+
+    debug(message=f"User: {main_profile} || Reusing scores of {reused} of {len(main_profile_data['matching_profiles'])} matching profiles", type="info", separator=f"\n    [>] ")
+
+
+# >> function to get closest matching profiles of a main profile and format them as rows of output file
+def select_closest_profiles(main_profile: str) -> list:
+    """function to get top_k closest matching profiles of a main profile and format them as rows of output file
+
+    Args:
+        main_profile (str): username of the main_account
+
+    Returns:
+        list: rows of output file, empty if main profile has no matching profiles
+    """
+
+    main_profile_data = get_profile_data(main_profile)
+    drop_profile_data(main_profile)
+    if not 'matching_profiles' in main_profile_data:
+        return []
+
+    delta_store = get_delta_store()
+    if delta_store:
+        delta_store.save(main_profile, main_profile_data)
+
+    closest_profiles = get_top_matching_profiles(main_profile_data["matching_profiles"], CONFIG["top_k"])
+    if not closest_profiles:
+        debug(message=f"User: {main_profile} || No matching profiles found", type="info", separator=f"\n    [>] ")
+
+    rows = []
+    avatar_index = get_avatar_index()
+    for rank, closest_profile in enumerate(closest_profiles, start=1):
+        row = {
             "Real Account": f"https://www.tiktok.com/@{main_profile}",
             "R Followers Count": main_profile_data["main_profile"]["follower_count"],
             "Fake Account Link": f"https://www.tiktok.com/@{closest_profile['username']}",
             "F Followers Count": closest_profile["follower_count"],
             "Percentage": closest_profile["comparison_score"],
             "Status": True if closest_profile["comparison_score"] >= CONFIG['min_fake_score'] else False
-        })
+        }
 
-        # Saving profiles to respective JSONs. ONLY FOR TESTING
-        if not CONFIG["save_json"]:
-            os.remove(os.path.join(OUTPUT_FOLDER, "JSONs", f"{main_profile}.json"))
-    
-    # saving closest matching profiles in csv
-    if closest_matching_profiles:
-        save_csv(closest_matching_profiles, OUTPUT_CSV_FILE)
+        # component scores of every suspect when more than one suspect is asked for
+        if CONFIG["top_k"] > 1:
+            row["Rank"] = rank
+            row["Avatar Similarity"] = closest_profile["avatar_similarity"]
+            row["Name Similarity"] = closest_profile["name_similarity"]
+            row["Bio Similarity"] = closest_profile["bio_similarity"]
+
+        # remembering avatar of impostor so that its copies are found in later scans
+        if avatar_index:
+            row["Known Avatar Matches"] = ", ".join(closest_profile.get("known_avatar_matches", []))
+            dhash = get_avatar_dhash(closest_profile.get("avatar_hash"))
+            if row["Status"] and dhash is not None:
+                avatar_index.add(dhash, f"impostor:{closest_profile['username']}")
+
+        rows.append(row)
+
+    return rows
+
+
+# >> seconds each pipeline stage has spent working, summed over all its workers
+STAGE_TIMINGS = {}
+
+
+# >> function to run one stage of pipeline with its own workers
+async def pipeline_stage(name: str, handler, in_queue: asyncio.Queue, out_queue: asyncio.Queue, worker_count: int, next_worker_count: int, batch_size: int=None) -> None:
+    """function to run one stage of pipeline. Workers take items from in_queue till they get None and put result of handler on out_queue.
+        Once all workers are done, one None is put on out_queue for each worker of next stage.
+
+    Args:
+        name (str): name of the stage
+        handler (coroutine function): function that processes an item, returning None drops the item
+        in_queue (asyncio.Queue): queue items are taken from
+        out_queue (asyncio.Queue): queue results are put on, None for last stage
+        worker_count (int): number of workers of this stage
+        next_worker_count (int): number of workers of next stage
+        batch_size (int, optional): when set, handler gets a list of up to batch_size items already waiting in queue and returns list of results. Defaults to None.
+    """
+
+    STAGE_TIMINGS.setdefault(name, 0.0)
+
+    async def worker():
+        done = False
+        while not done:
+            item = await in_queue.get()
+            if item is None:
+                break
+
+            # taking items already waiting in queue, without waiting for more
+            if batch_size:
+                item = [ item ]
+                while len(item) < batch_size and not in_queue.empty():
+                    next_item = in_queue.get_nowait()
+                    if next_item is None:
+                        done = True
+                        break
+                    item.append(next_item)
+
+            started = time.perf_counter()
+            try:
+                result = await handler(item)
+            except Exception as e:
+                debug(message=f"Exception in {name} stage for {item} || {e}", type="exception", separator="\n    [xx] ")
+                METRICS.increment("stage_failures_total", stage=name)
+                result = None
+            STAGE_TIMINGS[name] += time.perf_counter() - started
+            METRICS.observe("stage_seconds", time.perf_counter() - started, stage=name)
+
+            if result is None or out_queue is None:
+                continue
+            for output in (result if batch_size else [ result ]):
+                if output is not None:
+                    await out_queue.put(output)
+
+    await asyncio.gather(*[ worker() for _ in range(worker_count) ])
+    for _ in range(next_worker_count if out_queue is not None else 0):
+        await out_queue.put(None)
+
+
+# >> append only journal of rows selected for every main profile in a run
+class RunJournal:
+    """append only journal of rows selected for every main profile in a run. Each line is a JSON record, so a run that fails partway
+        can be resumed without scanning main profiles that are already done. First record is the key of the run, made from input file
+        and scoring config, and last record of a run that finished cleanly marks it complete. Only rows are kept, as fetching and
+        downloading again are cheap with response cache and avatar store.
+    """
+
+    def __init__(self, file: str, fsync_every: int=20):
+        """
+        Args:
+            file (str): complete path of the journal file
+            fsync_every (int, optional): records written before journal is forced to disk. Defaults to 20.
+        """
+
+        self.file = file
+        self.fsync_every = fsync_every
+        self.lock = threading.Lock()
+        self.handle = None
+        self.writes = 0
+
+    def start(self, run_key: str, resume: bool=False) -> dict:
+        """function to open journal for writing
+
+        Args:
+            run_key (str): key of this run, see get_run_key
+            resume (bool, optional): keep records of last run and return them, else journal is emptied. Defaults to False.
+
+        Returns:
+            dict: rows of main profiles already done, keyed by main profile
+        """
+
+        states = self.load(run_key) if resume else None
+        if states is None:
+            self.handle = open(self.file, 'w', encoding='utf-8')
+            self.write({"run": run_key})
+            return {}
+
+        # half written last line of a killed run is ended, so that next record starts on its own line
+        last_character = b"\n"
+        with open(self.file, 'rb') as r:
+            if r.seek(0, os.SEEK_END):
+                r.seek(-1, os.SEEK_END)
+                last_character = r.read(1)
+        self.handle = open(self.file, 'a', encoding='utf-8')
+        if last_character != b"\n":
+            self.handle.write("\n")
+        return states
+
+    def load(self, run_key: str) -> dict:
+        """function to read rows of main profiles already done from journal of an unfinished run
+
+        Args:
+            run_key (str): key of this run, journal of a run with other input file or config is not used
+
+        Returns:
+            dict: rows keyed by main profile, None if there is no unfinished run with same key
+        """
+
+        if not os.path.exists(self.file):
+            return None
+
+        states = {}
+        with open(self.file, 'r', encoding='utf-8') as r:
+            for number, line in enumerate(r):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line may be half written if run was killed
+                    continue
+
+                if number == 0:
+                    if record.get("run") != run_key:
+                        debug(message=f"Journal {self.file} is of another input file or config, starting a new run", type="warning", separator="    [xx] ")
+                        return None
+                elif record.get("complete"):
+                    return None
+                elif "main_profile" in record:
+                    states[record["main_profile"]] = record["rows"]
+        return states
+
+    def write(self, record: dict) -> None:
+        """function to append a record to journal
+
+        Args:
+            record (dict): record to be written
+        """
+
+        line = json.dumps(record)
+        with self.lock:
+            self.handle.write(line + "\n")
+            self.handle.flush()
+
+            self.writes += 1
+            if self.writes % self.fsync_every == 0:
+                os.fsync(self.handle.fileno())
+
+    def record(self, main_profile: str, rows: list) -> None:
+        """function to record rows selected for a main profile
+
+        Args:
+            main_profile (str): username of the main_account
+            rows (list): rows of output file of the main profile
+        """
+
+        self.write({"main_profile": main_profile, "rows": rows})
+
+    def finish(self) -> None:
+        """function to mark run complete, close journal and move it aside, so next run starts fresh"""
+        if not self.handle:
+            return
+        self.write({"complete": True})
+        self.close()
+        os.replace(self.file, f"{self.file}.done")
+
+    def close(self) -> None:
+        """function to force journal to disk and close it"""
+        with self.lock:
+            if self.handle:
+                self.handle.flush()
+                os.fsync(self.handle.fileno())
+                self.handle.close()
+                self.handle = None
+
+
+RUN_JOURNAL = None
+
+
+# >> function to get run journal, journal is created on first use
+def get_run_journal() -> RunJournal:
+    """function to get run journal, journal is created on first use
+
+    Returns:
+        RunJournal: shared run journal, None if journal is disabled in config
+    """
+
+    global RUN_JOURNAL
+    if RUN_JOURNAL is None and CONFIG["journal"]["enabled"]:
+        if not os.path.exists(OUTPUT_FOLDER):
+            os.makedirs(OUTPUT_FOLDER)
+        RUN_JOURNAL = RunJournal(os.path.join(OUTPUT_FOLDER, CONFIG["journal"]["file"]))
+    return RUN_JOURNAL
+
+
+# >> function to get key of a run from input file and config that decides the rows
+def get_run_key() -> str:
+    """function to get key of a run from input file and config that decides the rows, so journal of a run is resumed only by same run
+
+    Returns:
+        str: key of the run
+    """
+
+    # input file is read from project folder, same as read_input does
+    input_file = os.path.join(BASE_FOLDER, CONFIG["input_file"])
+    input_hash = None
+    if os.path.exists(input_file):
+        input_hash = hashlib.sha1()
+        with open(input_file, 'rb') as r:
+            for chunk in iter(lambda: r.read(1024 * 1024), b""):
+                input_hash.update(chunk)
+        input_hash = input_hash.hexdigest()
+
+    key = {
+        "input_file": os.path.abspath(input_file),
+        "input_hash": input_hash,
+        "config": { name: CONFIG[name] for name in ("weightage", "min_similarity", "min_fake_score", "top_k") }
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# >> function to record in run journal the rows selected for a main profile
+def journal_rows(main_profile: str, rows: list) -> None:
+    """function to record in run journal the rows selected for a main profile
+
+    Args:
+        main_profile (str): username of the main_account
+        rows (list): rows of output file of the main profile
+    """
+
+    if RUN_JOURNAL and RUN_JOURNAL.handle:
+        RUN_JOURNAL.record(main_profile, rows)
+
+
+# >> shared queue of main profiles, worker processes on this host lease main profiles from it and report their rows back
+class WorkQueue:
+    """sqlite backed queue of main profiles shared by a coordinator and its workers. A worker leases a batch of main profiles for
+        lease_seconds, a lease that is not renewed or completed in time goes back to the queue so another worker can pick it up.
+        Queue is for workers on a single host, as sqlite locking is not reliable over network drives. Spreading a scan over many
+        hosts needs a real broker.
+    """
+
+    def __init__(self, file: str, lease_seconds: int=300, max_attempts: int=3):
+        """
+        Args:
+            file (str): complete path of the sqlite file on a local disk
+            lease_seconds (int, optional): seconds a leased main profile is held by a worker. Defaults to 300.
+            max_attempts (int, optional): leases of a main profile before it is given up. Defaults to 3.
+        """
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS work (main_profile TEXT PRIMARY KEY, status TEXT, worker TEXT, lease_until REAL, attempts INTEGER, rows TEXT)"
+        )
+
+    def load(self, main_profiles, chunk_size: int=1000) -> int:
+        """function to add main profiles to the queue, main profiles already in the queue are left as they are
+
+        Args:
+            main_profiles (iterable): usernames of main profiles
+            chunk_size (int, optional): main profiles added in one transaction. Defaults to 1000.
+
+        Returns:
+            int: number of main profiles added
+        """
+
+        def insert(chunk):
+            with self.lock:
+                before = self.connection.total_changes
+                self.connection.execute("BEGIN IMMEDIATE")
+                self.connection.executemany("INSERT OR IGNORE INTO work (main_profile, status, attempts) VALUES (?, 'pending', 0)", chunk)
+                self.connection.execute("COMMIT")
+                return self.connection.total_changes - before
+
+        added = 0
+        chunk = []
+        for main_profile in main_profiles:
+            chunk.append((main_profile,))
+            if len(chunk) >= chunk_size:
+                added += insert(chunk)
+                chunk = []
+        if chunk:
+            added += insert(chunk)
+        return added
+
+    def reclaim(self) -> int:
+        """function to take back main profiles whose lease has expired, e.g. their worker has died. They go back to pending,
+            or are given up once they have been leased max_attempts times.
+
+        Returns:
+            int: number of main profiles taken back
+        """
+
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute(
+                "UPDATE work SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL WHERE status = 'leased' AND lease_until < ?",
+                (self.max_attempts, time.time())
+            )
+            return self.connection.total_changes - before
+
+    def lease(self, worker: str, count: int) -> list:
+        """function to lease main profiles that are pending, expired leases are taken back first
+
+        Args:
+            worker (str): id of the worker
+            count (int): max number of main profiles to lease
+
+        Returns:
+            list: usernames of leased main profiles, empty when nothing is left to lease
+        """
+
+        self.reclaim()
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                main_profiles = [
+                    row[0] for row in self.connection.execute("SELECT main_profile FROM work WHERE status = 'pending' LIMIT ?", (count,))
+                ]
+                self.connection.executemany(
+                    "UPDATE work SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE main_profile = ?",
+                    [ (worker, now + self.lease_seconds, main_profile) for main_profile in main_profiles ]
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        return main_profiles
+
+    def renew(self, worker: str) -> None:
+        """function to extend lease of every main profile held by a worker
+
+        Args:
+            worker (str): id of the worker
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "UPDATE work SET lease_until = ? WHERE status = 'leased' AND worker = ?", (time.time() + self.lease_seconds, worker)
+            )
+
+    def complete(self, main_profile: str, worker: str, rows: list) -> None:
+        """function to report rows of a main profile, report of a worker that lost its lease is ignored
+
+        Args:
+            main_profile (str): username of the main_account
+            worker (str): id of the worker
+            rows (list): rows of output file of the main profile
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "UPDATE work SET status = 'done', rows = ? WHERE main_profile = ? AND status = 'leased' AND worker = ?",
+                (json.dumps(rows), main_profile, worker)
+            )
+
+    def release(self, main_profiles: list, worker: str) -> None:
+        """function to give back main profiles a worker could not finish, so that they can be leased again
+
+        Args:
+            main_profiles (list): usernames of main profiles
+            worker (str): id of the worker
+        """
+
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE work SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL WHERE main_profile = ? AND status = 'leased' AND worker = ?",
+                [ (self.max_attempts, main_profile, worker) for main_profile in main_profiles ]
+            )
+
+    def fail(self, main_profiles: list, worker: str) -> None:
+        """function to give up main profiles that can never succeed, e.g. user does not exist, without leasing them again
+
+        Args:
+            main_profiles (list): usernames of main profiles
+            worker (str): id of the worker
+        """
+
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE work SET status = 'failed', worker = NULL WHERE main_profile = ? AND status = 'leased' AND worker = ?",
+                [ (main_profile, worker) for main_profile in main_profiles ]
+            )
+
+    def counts(self) -> dict:
+        """function to get number of main profiles in every status, expired leases are taken back first so they count as pending or failed
+
+        Returns:
+            dict: number of main profiles, keyed by status
+        """
+
+        self.reclaim()
+        with self.lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+
+    def results(self, chunk_size: int=1000):
+        """function to get rows reported for all main profiles, read from queue in chunks so that they are never all held in memory
+
+        Args:
+            chunk_size (int, optional): main profiles read in one go. Defaults to 1000.
+
+        Yields:
+            dict: row of output file
+        """
+
+        last_main_profile = ""
+        while True:
+            with self.lock:
+                chunk = self.connection.execute(
+                    "SELECT main_profile, rows FROM work WHERE status = 'done' AND main_profile > ? ORDER BY main_profile LIMIT ?", (last_main_profile, chunk_size)
+                ).fetchall()
+            if not chunk:
+                return
+
+            for last_main_profile, data in chunk:
+                yield from json.loads(data)
+
+    def close(self) -> None:
+        """function to close the sqlite file"""
+        with self.lock:
+            self.connection.close()
+
+
+WORK_QUEUE = None
+
+
+# >> function to get work queue, queue is created on first use
+def get_work_queue() -> WorkQueue:
+    """function to get work queue, queue is created on first use
+
+    Returns:
+        WorkQueue: shared work queue, None if work queue is disabled in config
+    """
+
+    global WORK_QUEUE
+    if WORK_QUEUE is None and CONFIG["work_queue"]["enabled"]:
+        if not os.path.exists(OUTPUT_FOLDER):
+            os.makedirs(OUTPUT_FOLDER)
+        WORK_QUEUE = WorkQueue(
+            os.path.join(OUTPUT_FOLDER, CONFIG["work_queue"]["file"]),
+            lease_seconds=CONFIG["work_queue"]["lease_seconds"],
+            max_attempts=CONFIG["work_queue"]["max_attempts"]
+        )
+    return WORK_QUEUE
+
+
+# >> function to lease main profiles from work queue and run them through the pipeline until queue is empty
+def run_queue_worker(work_queue: WorkQueue, resumed_rows: dict=None) -> int:
+    """function to lease main profiles from work queue and run them through the pipeline until queue is empty
+
+    Args:
+        work_queue (WorkQueue): shared work queue
+        resumed_rows (dict, optional): rows of main profiles already done, keyed by main profile, as read from run journal. Defaults to None.
+
+    Returns:
+        int: number of main profiles completed by this worker
+    """
+
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    completed = 0
+
+    # lease is renewed in background while a batch is running
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(work_queue.lease_seconds / 3):
+            work_queue.renew(worker)
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    try:
+        while True:
+            main_profiles = work_queue.lease(worker, CONFIG["work_queue"]["batch_size"])
+            if not main_profiles:
+                break
+            debug(message=f"Worker {worker} leased {len(main_profiles)} main profiles", type="info", separator=f"\n [+] ")
+
+            finished = set()
+            def on_result(main_profile, rows):
+                work_queue.complete(main_profile, worker, rows)
+                finished.add(main_profile)
+
+            get_http_engine().run(run_pipeline(main_profiles, resumed_rows, on_result=on_result))
+            completed += len(finished)
+
+            # main profiles api does not know are given up, others which failed in fetch or download stage are tried again by some worker
+            unfinished = [ main_profile for main_profile in main_profiles if main_profile not in finished ]
+            work_queue.fail([ main_profile for main_profile in unfinished if main_profile in UNKNOWN_PROFILES ], worker)
+            work_queue.release([ main_profile for main_profile in unfinished if main_profile not in UNKNOWN_PROFILES ], worker)
+            UNKNOWN_PROFILES.difference_update(main_profiles)
+            PROFILE_STORE.clear()
+    finally:
+        stop.set()
+
+    return completed
+
+
+# >> function to run streaming pipeline over main profiles
+async def run_pipeline(main_profiles: list, resumed_rows: dict=None, on_result=None) -> list:
+    """function to run streaming pipeline over main profiles. Stages are connected by bounded queues, so a main profile moves to
+        downloading as soon as its matching profiles are fetched and to scoring as soon as its avatars are downloaded.
+        Main profiles found in resumed_rows are not scanned again, their rows are delivered as they are.
+
+    Args:
+        main_profiles (list): usernames of main profiles
+        resumed_rows (dict, optional): rows of main profiles already done, keyed by main profile, as read from run journal. Defaults to None.
+        on_result (callable, optional): called with main profile and its rows as soon as its closest matching profile is selected. Defaults to None.
+
+    Returns:
+        list: closest matching profile of each main profile, formatted as rows of output file. Rows are only collected when on_result is not given
+    """
+
+    loop = asyncio.get_running_loop()
+    fetch_workers = CONFIG["pipeline"]["fetch_workers"]
+    download_workers = CONFIG["pipeline"]["download_workers"]
+    score_workers = CONFIG["pipeline"]["score_workers"]
+    queue_size = CONFIG["pipeline"]["queue_size"]
+
+    fetch_queue = asyncio.Queue(maxsize=queue_size)
+    download_queue = asyncio.Queue(maxsize=queue_size)
+    score_queue = asyncio.Queue(maxsize=queue_size)
+    select_queue = asyncio.Queue(maxsize=queue_size)
+
+    started = time.perf_counter()
+    closest_matching_profiles = []
+    selected = []
+
+    def deliver(main_profile, rows):
+        if on_result:
+            on_result(main_profile, rows)
+        else:
+            closest_matching_profiles.extend(rows)
+
+    async def feed():
+        resumed = []
+        for main_profile in main_profiles:
+            if main_profile in (resumed_rows or {}):
+                resumed.append(main_profile)
+                deliver(main_profile, resumed_rows[main_profile])
+            else:
+                await fetch_queue.put(main_profile)
+
+        if resumed:
+            debug(message=f"Resumed {len(resumed)} main profiles from journal", type="info", separator=f"\n [+] ")
+        for _ in range(fetch_workers):
+            await fetch_queue.put(None)
+
+    # data of a main profile dropped by a stage, on failure or exception, is removed from profile store so that it is not kept forever
+    async def fetch(main_profile):
+        done = False
+        try:
+            if await get_profile_data_thread(main_profile):
+                apply_delta_state(main_profile)
+                done = True
+        finally:
+            if not done:
+                drop_profile_data(main_profile)
+        return main_profile if done else None
+
+    async def download(main_profile):
+        done = False
+        try:
+            done = bool(await download_profile_avatars(main_profile))
+        finally:
+            if not done:
+                drop_profile_data(main_profile)
+        return main_profile if done else None
+
+    async def score(main_profiles):
+        done = False
+        try:
+            batch = [ get_profile_data(main_profile) for main_profile in main_profiles ]
+            try:
+                batch, snapshot = await loop.run_in_executor(get_score_executor(), score_profiles_in_worker, batch)
+            except concurrent.futures.BrokenExecutor:
+                # a scoring worker has died, batch is tried once more on a new pool
+                debug(message=f"Scoring pool is broken, starting a new one", type="error", separator="    [xx] ")
+                reset_score_executor()
+                batch, snapshot = await loop.run_in_executor(get_score_executor(), score_profiles_in_worker, batch)
+            if snapshot:
+                METRICS.merge(snapshot)
+            for main_profile, main_profile_data in zip(main_profiles, batch):
+                # check avatars against every protected account and known impostor
+                index_profile_avatars(main_profile_data)
+                put_profile_data(main_profile, main_profile_data)
+            done = True
+        finally:
+            if not done:
+                for main_profile in main_profiles:
+                    drop_profile_data(main_profile)
+        return main_profiles
+
+    async def select(main_profile):
+        rows = select_closest_profiles(main_profile)
+        journal_rows(main_profile, rows)
+        if rows and not selected:
+            debug(message=f"Time to first result: {time.perf_counter() - started:.2f} seconds", type="info", separator=f"\n [+] ")
+        selected.append(main_profile)
+        deliver(main_profile, rows)
+
+    await asyncio.gather(
+        feed(),
+        pipeline_stage("fetch", fetch, fetch_queue, download_queue, fetch_workers, download_workers),
+        pipeline_stage("download", download, download_queue, score_queue, download_workers, score_workers),
+        pipeline_stage("score", score, score_queue, select_queue, score_workers, 1, batch_size=CONFIG["scoring"]["chunk_size"]),
+        pipeline_stage("select", select, select_queue, None, 1, 0)
+    )
+
+    return closest_matching_profiles
+
+
+# >> headless service that keeps engine, caches and worker pools warm and scans main profiles posted to it
+class ScanService:
+    """headless service that scans main profiles posted to a local http api. Http engine, caches, avatar features and scoring workers
+        stay warm between jobs, and rows of every main profile are streamed back as newline delimited JSON as soon as it is selected.
+
+        POST /scan    {"usernames": [...]}, streams {"main_profile": ..., "row": {...}} lines and a final {"done": true, ...} line
+        GET /health   state of the service
+        GET /metrics  metrics of all jobs in prometheus text format
+    """
+
+    def __init__(self, host: str, port: int, max_profiles_per_job: int=1000):
+        """
+        Args:
+            host (str): interface to listen on, keep it local as api has no authentication
+            port (int): port to listen on
+            max_profiles_per_job (int, optional): max main profiles accepted in one job. Defaults to 1000.
+        """
+
+        self.max_profiles_per_job = max_profiles_per_job
+        self.condition = threading.Condition()
+        self.in_flight = set()
+        self.jobs_done = 0
+        self.started = time.time()
+
+        service = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                service.handle_get(self)
+
+            def do_POST(self):
+                service.handle_post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def warm_up(self) -> None:
+        """function to start http engine, caches and scoring workers before first job comes in"""
+        get_http_engine()
+        get_rate_limiter()
+        get_response_cache()
+        get_avatar_index()
+        get_delta_store()
+
+        # starting a scoring worker, so that first job does not wait for it
+        get_score_executor().submit(score_profiles_batch, []).result()
+
+    def serve(self) -> None:
+        """function to serve jobs until interrupted"""
+        self.warm_up()
+        debug(message=f"Service listening on http://{self.server.server_address[0]}:{self.server.server_address[1]}", type="info", separator=f"\n [+] ")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            debug(message=f"Service stopped", type="info", separator=f"\n [+] ")
+        finally:
+            self.server.server_close()
+            if AVATAR_INDEX:
+                AVATAR_INDEX.save()
+
+    @staticmethod
+    def send(request: http.server.BaseHTTPRequestHandler, status: int, body: bytes, content_type: str="application/json") -> None:
+        """function to write a complete response
+
+        Args:
+            request (http.server.BaseHTTPRequestHandler): request to be answered
+            status (int): status code
+            body (bytes): body of response
+            content_type (str, optional): content type of body. Defaults to "application/json".
+        """
+
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def handle_get(self, request: http.server.BaseHTTPRequestHandler) -> None:
+        """function to answer health and metrics requests
+
+        Args:
+            request (http.server.BaseHTTPRequestHandler): request to be answered
+        """
+
+        if request.path == "/health":
+            with self.condition:
+                health = { "status": "ok", "uptime": round(time.time() - self.started, 1), "in_flight": len(self.in_flight), "jobs_done": self.jobs_done }
+            self.send(request, 200, json.dumps(health).encode("utf-8"))
+        elif request.path == "/metrics":
+            self.send(request, 200, METRICS.prometheus().encode("utf-8"), content_type="text/plain; version=0.0.4")
+        else:
+            self.send(request, 404, b'{"error": "not found"}')
+
+    def handle_post(self, request: http.server.BaseHTTPRequestHandler) -> None:
+        """function to run a scan job and stream its rows back
+
+        Args:
+            request (http.server.BaseHTTPRequestHandler): request to be answered
+        """
+
+        if request.path != "/scan":
+            return self.send(request, 404, b'{"error": "not found"}')
+
+        try:
+            job = json.loads(request.rfile.read(int(request.headers.get("Content-Length") or 0)) or b"{}")
+            main_profiles = list(dict.fromkeys( str(username).strip().split("/@")[-1].lstrip("@") for username in job["usernames"] if str(username).strip() ))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send(request, 400, json.dumps({ "error": f"body must be JSON with a list of usernames || {e}" }).encode("utf-8"))
+        if not main_profiles or len(main_profiles) > self.max_profiles_per_job:
+            return self.send(request, 400, json.dumps({ "error": f"send between 1 and {self.max_profiles_per_job} usernames" }).encode("utf-8"))
+
+        # response is streamed without content length, client reads lines until connection is closed
+        request.send_response(200)
+        request.send_header("Content-Type", "application/x-ndjson")
+        request.end_headers()
+
+        def write(line):
+            request.wfile.write((json.dumps(line, default=str) + "\n").encode("utf-8"))
+            request.wfile.flush()
+
+        started = time.perf_counter()
+        rows = 0
+        client_connected = True
+        for main_profile, row in self.run_job(main_profiles):
+            rows += 1
+            if client_connected:
+                try:
+                    write({ "main_profile": main_profile, "row": row })
+                except OSError:
+                    # job keeps running so that its results still reach caches and delta state
+                    client_connected = False
+
+        if client_connected:
+            try:
+                write({ "done": True, "profiles": len(main_profiles), "rows": rows, "seconds": round(time.perf_counter() - started, 3) })
+            except OSError:
+                pass
+
+    def run_job(self, main_profiles: list):
+        """function to run main profiles through the pipeline on warm http engine. Main profiles being scanned by another job are
+            waited for, as data of a main profile is kept in shared profile store while it is in the pipeline.
+
+        Args:
+            main_profiles (list): usernames of main profiles
+
+        Yields:
+            tuple: main profile and a row of output file, as soon as main profile is selected
+        """
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight.isdisjoint(main_profiles))
+            self.in_flight.update(main_profiles)
+
+        results = queue.Queue()
+        def on_result(main_profile, rows):
+            for row in rows:
+                results.put((main_profile, row))
+
+        future = asyncio.run_coroutine_threadsafe(run_pipeline(main_profiles, on_result=on_result), get_http_engine().loop)
+        try:
+            while not (future.done() and results.empty()):
+                try:
+                    yield results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            future.result()
+        except Exception as e:
+            debug(message=f"Exception while running job of {len(main_profiles)} main profiles || {e}", type="exception", separator="\n    [xx] ")
+        finally:
+            UNKNOWN_PROFILES.difference_update(main_profiles)
+            with self.condition:
+                self.in_flight.difference_update(main_profiles)
+                self.jobs_done += 1
+                self.condition.notify_all()
+
+            # searches and downloads are shared only while they are running, so results of a job never outlive it and
+            # later jobs go through response cache with its ttl. Caches on disk and features in memory stay warm
+            get_http_engine().loop.call_soon_threadsafe(forget_finished_requests)
+
+            if AVATAR_INDEX:
+                AVATAR_INDEX.save()
+
+
+# >> function to forget searches and avatar downloads that have finished
+def forget_finished_requests() -> None:
+    """function to forget searches and avatar downloads that have finished, searches and downloads still running stay shared.
+        Function is intended to run on event loop of http engine, as that is where the maps are changed.
+    """
+
+    for requests_map in (SEARCH_REQUESTS, AVATAR_DOWNLOADS):
+        for key in [ key for key, future in requests_map.items() if future.done() ]:
+            del requests_map[key]
+
+
+# >> function to print summary of metrics and export them
+def save_metrics() -> None:
+    """function to print summary table of metrics of the run and export them as JSON and prometheus textfile, as set in config"""
+
+    debug(message=f"Metrics of the run", type="info", separator=f"\n [+] ")
+    for line in METRICS.summary().split("\n"):
+        debug(message=line, type="info", separator="    ")
+
+    try:
+        if CONFIG["metrics"]["json_file"]:
+            METRICS.export_json(os.path.join(OUTPUT_FOLDER, CONFIG["metrics"]["json_file"]))
+        if CONFIG["metrics"]["prometheus_file"]:
+            METRICS.export_prometheus(os.path.join(OUTPUT_FOLDER, CONFIG["metrics"]["prometheus_file"]))
+    except Exception as e:
+        debug(message=f"Exception while exporting metrics || {e}", type="exception", separator="\n    [xx] ")
+
+
+# >> function where all magic happens
+def main(resume: bool=False, role: str=None):
+    """function where all magic happens
+
+    Args:
+        resume (bool, optional): skip main profiles already done by last run, if it was stopped before finishing. Defaults to False.
+        role (str, optional): coordinator or worker of work queue, work queue is used whenever role is given. Defaults to work_queue.role in config.
+    """
+
+    SEARCH_REQUESTS.clear()
+    AVATAR_DOWNLOADS.clear()
+    UNKNOWN_PROFILES.clear()
+    STAGE_TIMINGS.clear()
+    PROFILE_STORE.clear()
+    METRICS.clear()
+
+    if role:
+        CONFIG["work_queue"]["enabled"] = True
+        CONFIG["work_queue"]["role"] = role
+    work_queue = get_work_queue()
+
+    # ! OPEN RUN JOURNAL, WITH RESUME FINISHED WORK OF LAST RUN IS SKIPPED
+    # workers report rows to work queue, which keeps them between runs, and journal file belongs to coordinator of same folder
+    resumed_rows = {}
+    run_journal = None if work_queue and CONFIG["work_queue"]["role"] == "worker" else get_run_journal()
+    if run_journal:
+        resumed_rows = run_journal.start(get_run_key(), resume=resume)
+
+    result_sink = None
+    if work_queue:
+        # ! COORDINATOR LOADS INPUT FILE INTO SHARED QUEUE, COORDINATOR AND WORKERS LEASE MAIN PROFILES FROM IT
+        if CONFIG["work_queue"]["role"] == "coordinator":
+            added = work_queue.load(iter_input(CONFIG["input_file"]))
+            debug(message=f"Main profiles added to work queue = {added}", type="info", separator=f"\n [+] ")
+
+        debug(message=f"Starting pipeline on work queue", type="info", separator=f"\n [+] ")
+        completed = run_queue_worker(work_queue, resumed_rows)
+        if run_journal:
+            run_journal.finish()
+        debug(message=f"Main profiles completed by this worker = {completed} || Done pipeline || " + " || ".join(f"{name}: {seconds:.2f}s" for name, seconds in STAGE_TIMINGS.items()), type="info", separator=f"\n [+] ")
+
+        if CONFIG["work_queue"]["role"] != "coordinator":
+            if AVATAR_INDEX:
+                AVATAR_INDEX.save()
+            if CONFIG["metrics"]["enabled"]:
+                save_metrics()
+            return
+
+        # ! COORDINATOR WAITS FOR MAIN PROFILES STILL LEASED BY OTHER WORKERS AND MERGES ROWS OF ALL WORKERS
+        while True:
+            counts = work_queue.counts()
+            if not counts.get("pending") and not counts.get("leased"):
+                break
+            if counts.get("pending"):
+                # lease of a dead worker has expired and is taken back by counts, so pick its main profiles up here
+                run_queue_worker(work_queue)
+                continue
+            debug(message=f"Waiting for workers || " + " || ".join(f"{status}: {count}" for status, count in counts.items()), type="info", separator=f"\n [+] ")
+            time.sleep(CONFIG["work_queue"]["poll_interval"])
+        if counts.get("failed"):
+            debug(message=f"Main profiles not found or given up after {CONFIG['work_queue']['max_attempts']} attempts = {counts['failed']}", type="error", separator="    [xx] ")
+
+        # rows reported by all workers are streamed from queue to output file
+        result_sink = open_result_sink(OUTPUT_CSV_FILE)
+        for row in work_queue.results():
+            result_sink.write([ row ])
+    else:
+        # ! READ INPUT FILE 
+        main_profiles = list(set(read_input(CONFIG["input_file"])))
+        debug(message=f"Total number of main profiles = {len(main_profiles)}", type="info", separator=f"\n [+] ")
+
+        # ! FETCH MATCHING PROFILES, DOWNLOAD AVATARS, CALCULATE COMPARISON SCORE AND GET CLOSEST MATCH IN A STREAMING PIPELINE
+        # rows of every main profile are appended to output file as soon as it is selected
+        debug(message=f"Starting pipeline", type="info", separator=f"\n [+] ")
+        result_sink = open_result_sink(OUTPUT_CSV_FILE)
+        try:
+            get_http_engine().run(run_pipeline(main_profiles, resumed_rows, on_result=lambda main_profile, rows: result_sink.write(rows)))
+        finally:
+            result_sink.close()
+        if run_journal:
+            run_journal.finish()
+        debug(message=f"Done pipeline || " + " || ".join(f"{name}: {seconds:.2f}s" for name, seconds in STAGE_TIMINGS.items()), type="info", separator=f"\n [+] ")
+
+    result_sink.close()
+    if result_sink.rows:
+        debug(message=f"Rows saved to {result_sink.file} = {result_sink.rows}", type="info", separator=f"\n [+] ")
     else:
         debug(message=f"Not closest matching profiles profiles", type="error", separator="    [xx] ")
 
+    if AVATAR_INDEX:
+        AVATAR_INDEX.save()
+    debug(message=f"Avatars downloaded: {AVATAR_STORE_STATS['downloaded']} || Same url skipped: {AVATAR_STORE_STATS['url_duplicates']} || Same content skipped: {AVATAR_STORE_STATS['content_duplicates']} || Not needed: {AVATAR_STORE_STATS['lazy_skipped']}", type="info", separator=f"\n [+] ")
+    if RESPONSE_CACHE:
+        debug(message=f"Response cache hits: {RESPONSE_CACHE.hits} || Misses: {RESPONSE_CACHE.misses}", type="info", separator=f"\n [+] ")
+    if RATE_LIMITER:
+        debug(message=f"Rapid API requests made: {RATE_LIMITER.requests_made} || Throttled: {RATE_LIMITER.throttled_count} || Quota remaining: {RATE_LIMITER.quota_remaining}/{RATE_LIMITER.quota_limit}", type="info", separator=f"\n [+] ")
+
+    # ! PRINT METRICS OF THE RUN AND EXPORT THEM FOR MONITORING
+    if CONFIG["metrics"]["enabled"]:
+        save_metrics()
+
+
+# >> function to close engine, pools and files opened during the run
+def close_resources() -> None:
+    """function to close engine, pools and files opened during the run"""
+    if HTTP_ENGINE:
+        HTTP_ENGINE.close()
+    if SCORE_EXECUTOR:
+        SCORE_EXECUTOR.shutdown()
+    if RESPONSE_CACHE:
+        RESPONSE_CACHE.close()
+    if DELTA_STORE:
+        DELTA_STORE.close()
+    if WORK_QUEUE:
+        WORK_QUEUE.close()
+    if RUN_JOURNAL:
+        RUN_JOURNAL.close()
+
+
+# >> function to read command line arguments
+def parse_arguments() -> argparse.Namespace:
+    """function to read command line arguments. Without arguments script asks for project folder and output file, as the executable always did
+
+    Returns:
+        argparse.Namespace: command line arguments
+    """
+
+    parser = argparse.ArgumentParser(description="Tiktok scraper to get closest matching profile")
+    parser.add_argument("--base-folder", help="path to the project folder, skips the prompt")
+    parser.add_argument("--output", help="name of output file, skips the prompt")
+    parser.add_argument("--resume", action="store_true", help="skip main profiles already done by last run, if it was stopped before finishing")
+    parser.add_argument("--role", choices=["coordinator", "worker"], help="run on work queue as coordinator or worker, so workers can share the project folder. Defaults to work_queue in config")
+    parser.add_argument("--service", action="store_true", help="run as headless service that scans usernames posted to a local http api")
+    parser.add_argument("--host", help="interface the service listens on. Defaults to service.host in config")
+    parser.add_argument("--port", type=int, help="port the service listens on. Defaults to service.port in config")
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
+    # needed by process pool when script is frozen into an executable
+    multiprocessing.freeze_support()
+    arguments = parse_arguments()
+    interactive = not arguments.base_folder
+
     try:
         time_started = datetime.datetime.now()
         intro()
@@ -655,15 +3502,21 @@ if __name__ == '__main__':
         # # when we are executing script
         # BASE_FOLDER = os.path.dirname(__file__)
 
-        # get the base folder from user when we are executing executable
-        while True:
-            BASE_FOLDER = input("Please enter path to the project folder: ")
-            if os.path.exists(BASE_FOLDER) and os.path.exists(os.path.join(BASE_FOLDER, "scraper.exe")):
-                break
-            print("Not a valid path.")
+        if arguments.base_folder:
+            BASE_FOLDER = arguments.base_folder
+        else:
+            # get the base folder from user when we are executing executable
+            while True:
+                BASE_FOLDER = input("Please enter path to the project folder: ")
+                if os.path.exists(BASE_FOLDER) and os.path.exists(os.path.join(BASE_FOLDER, "scraper.exe")):
+                    break
+                print("Not a valid path.")
 
         #  getting name of output file
-        OUTPUT_CSV_FILE = input("Please enter name of output file: ").replace(".csv", "").strip()
+        if arguments.output or arguments.service:
+            OUTPUT_CSV_FILE = (arguments.output or "service").replace(".csv", "").strip()
+        else:
+            OUTPUT_CSV_FILE = input("Please enter name of output file: ").replace(".csv", "").strip()
         OUTPUT_CSV_FILE += ".csv"
         OUTPUT_FOLDER = os.path.join(BASE_FOLDER, "DATA")
 
@@ -677,7 +3530,15 @@ if __name__ == '__main__':
         CONFIG = read_config()
         if CONFIG:
             logger = set_logger()
-            main()
+            if arguments.service:
+                ScanService(
+                    arguments.host or CONFIG["service"]["host"],
+                    arguments.port or CONFIG["service"]["port"],
+                    max_profiles_per_job=CONFIG["service"]["max_profiles_per_job"]
+                ).serve()
+            else:
+                main(resume=arguments.resume, role=arguments.role)
+            close_resources()
         debug(message=f"Terminating Script **********\n", type="info", separator="\n  ********** ")
     except Exception as e:
         print(f"Exception in root: {e}")
@@ -685,6 +3546,7 @@ if __name__ == '__main__':
     time_ended = datetime.datetime.now()
     total_execution_time = time_ended - time_started
     print(f"\n Total Execution Time: {total_execution_time}")
-    input("\n All Task Done. Press Enter to close script ")
+    if interactive:
+        input("\n All Task Done. Press Enter to close script ")
 
 # pyinstaller --onefile -c --icon=tiktok.ico --add-data "venv\Lib\site-packages\pyfiglet;./pyfiglet"  scraper.py
\ No newline at end of file
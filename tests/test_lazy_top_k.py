@@ -0,0 +1,102 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper_threading
+
+
+# >> avatar distance of each stub avatar hash to avatar of main profile
+AVATAR_DISTANCES = {}
+
+
+# >> stub of download_avatar_thread, avatar hash is derived from avatar url
+async def download_avatar_thread(avatar_url: str) -> str:
+    return f"hash-{avatar_url}" if avatar_url else ""
+
+
+# >> stub of compare_avatars_batch, distances are looked up in AVATAR_DISTANCES
+def compare_avatars_batch(original_avatar_hash: str, matching_avatar_hashes: list) -> list:
+    return [ AVATAR_DISTANCES.get(avatar_hash, 10000000) if original_avatar_hash and avatar_hash else 10000000 for avatar_hash in matching_avatar_hashes ]
+
+
+# >> function to build main profile and its matching profiles with random names, bios and avatars
+def build_profile_data(seed: int, size: int) -> dict:
+    generator = random.Random(seed)
+    main_profile = {"username": "main", "fullname": "John Smith", "bio": "travel and food", "avatar_url": "main", "avatar_hash": "", "avatar_file": ""}
+    AVATAR_DISTANCES.clear()
+    matching_profiles = []
+    for index in range(size):
+        avatar_url = f"avatar-{seed}-{index}"
+        AVATAR_DISTANCES[f"hash-{avatar_url}"] = generator.choice([ 0.0, 0.05, 0.3, 0.9, 5.0 ])
+        matching_profiles.append({
+            "username": f"user{index}",
+            "fullname": generator.choice([ "John Smith", "Jon Smith", "Jane Doe", "" ]),
+            "bio": generator.choice([ "travel and food", "travel & food", "gaming", "" ]),
+            "avatar_url": avatar_url,
+            "avatar_hash": "",
+            "avatar_file": ""
+        })
+    return {"main_profile": main_profile, "matching_profiles": matching_profiles}
+
+
+class LazyTopKTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")) as config_file:
+            config = json.load(config_file)
+        config["debug"] = False
+        config["save_json"] = False
+        config["structural_check"]["enabled"] = False
+        self.patches = [
+            mock.patch.object(scraper_threading, "CONFIG", config, create=True),
+            mock.patch.object(scraper_threading, "logger", logging.getLogger("test_lazy_top_k"), create=True),
+            mock.patch.object(scraper_threading, "download_avatar_thread", download_avatar_thread),
+            mock.patch.object(scraper_threading, "compare_avatars_batch", compare_avatars_batch)
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.config = config
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        scraper_threading.PROFILE_STORE.clear()
+
+    # >> function to download avatars, score and return usernames and scores of top_k matching profiles
+    def get_top_k(self, main_profile_data: dict, lazy: bool) -> list:
+        self.config["lazy_avatar_download"] = lazy
+        scraper_threading.put_profile_data("main", copy.deepcopy(main_profile_data))
+        asyncio.run(scraper_threading.download_profile_avatars("main"))
+        scored_data = scraper_threading.score_profile_data(scraper_threading.get_profile_data("main"))
+        scraper_threading.drop_profile_data("main")
+        top_profiles = scraper_threading.get_top_matching_profiles(scored_data["matching_profiles"], self.config["top_k"])
+        return [ (profile["username"], profile["comparison_score"], profile["avatar_similarity"]) for profile in top_profiles ]
+
+    def test_lazy_matches_full_download(self):
+        for top_k in (1, 3, 5):
+            self.config["top_k"] = top_k
+            for seed in range(20):
+                main_profile_data = build_profile_data(seed, 30)
+                with self.subTest(top_k=top_k, seed=seed):
+                    self.assertEqual(self.get_top_k(main_profile_data, lazy=True), self.get_top_k(main_profile_data, lazy=False))
+
+    def test_no_candidates_gives_no_rows(self):
+        self.config["delta_scan"]["enabled"] = False
+        self.config["avatar_index"]["enabled"] = False
+        for top_k in (1, 3):
+            self.config["top_k"] = top_k
+            with self.subTest(top_k=top_k):
+                scraper_threading.put_profile_data("main", build_profile_data(0, 0))
+                self.assertEqual(scraper_threading.select_closest_profiles("main"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
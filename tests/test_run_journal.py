@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper_threading
+
+
+class RunJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")) as config_file:
+            config = json.load(config_file)
+        config["debug"] = False
+        self.patches = [
+            mock.patch.object(scraper_threading, "CONFIG", config, create=True),
+            mock.patch.object(scraper_threading, "BASE_FOLDER", self.folder.name, create=True),
+            mock.patch.object(scraper_threading, "logger", logging.getLogger("test_run_journal"), create=True)
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.config = config
+        self.file = os.path.join(self.folder.name, "journal.jsonl")
+        self.write_input("alpha\nbeta\n")
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.folder.cleanup()
+
+    def write_input(self, text: str) -> None:
+        with open(os.path.join(self.folder.name, self.config["input_file"]), 'w') as w:
+            w.write(text)
+
+    def test_run_key_follows_input_file_in_project_folder(self):
+        run_key = scraper_threading.get_run_key()
+        self.write_input("gamma\ndelta\n")
+        self.assertNotEqual(scraper_threading.get_run_key(), run_key)
+
+    def test_run_key_follows_scoring_config(self):
+        run_key = scraper_threading.get_run_key()
+        self.config["top_k"] += 1
+        self.assertNotEqual(scraper_threading.get_run_key(), run_key)
+
+    def test_resume_returns_rows_of_unfinished_run(self):
+        run_key = scraper_threading.get_run_key()
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(run_key), {})
+        run_journal.record("alpha", [ { "Real Account": "alpha" } ])
+        run_journal.close()
+
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(run_key, resume=True), { "alpha": [ { "Real Account": "alpha" } ] })
+        run_journal.close()
+
+    def test_journal_of_other_run_is_not_resumed(self):
+        run_journal = scraper_threading.RunJournal(self.file)
+        run_journal.start("other-run")
+        run_journal.record("alpha", [])
+        run_journal.close()
+
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(scraper_threading.get_run_key(), resume=True), {})
+        run_journal.close()
+
+    def test_complete_run_is_moved_aside_and_not_resumed(self):
+        run_key = scraper_threading.get_run_key()
+        run_journal = scraper_threading.RunJournal(self.file)
+        run_journal.start(run_key)
+        run_journal.record("alpha", [])
+        run_journal.finish()
+        self.assertFalse(os.path.exists(self.file))
+        self.assertTrue(os.path.exists(f"{self.file}.done"))
+
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(run_key, resume=True), {})
+        run_journal.close()
+
+    def test_half_written_last_line_is_skipped(self):
+        run_key = scraper_threading.get_run_key()
+        run_journal = scraper_threading.RunJournal(self.file)
+        run_journal.start(run_key)
+        run_journal.record("alpha", [])
+        run_journal.close()
+        with open(self.file, 'a') as w:
+            w.write('{"main_profile": "beta", "ro')
+
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(run_key, resume=True), { "alpha": [] })
+        run_journal.record("gamma", [])
+        run_journal.close()
+
+        run_journal = scraper_threading.RunJournal(self.file)
+        self.assertEqual(run_journal.start(run_key, resume=True), { "alpha": [], "gamma": [] })
+        run_journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
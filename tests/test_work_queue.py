@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper_threading
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.work_queue = scraper_threading.WorkQueue(os.path.join(self.folder.name, "work_queue.sqlite"), lease_seconds=0.05, max_attempts=2)
+        self.work_queue.load([ "alpha", "beta" ])
+
+    def tearDown(self):
+        self.work_queue.close()
+        self.folder.cleanup()
+
+    def test_expired_lease_of_dead_worker_goes_back_to_pending(self):
+        self.assertEqual(sorted(self.work_queue.lease("dead-worker", 10)), [ "alpha", "beta" ])
+        self.assertEqual(self.work_queue.counts(), { "leased": 2 })
+
+        time.sleep(0.1)
+        self.assertEqual(self.work_queue.counts(), { "pending": 2 })
+        self.assertEqual(sorted(self.work_queue.lease("live-worker", 10)), [ "alpha", "beta" ])
+
+    def test_expired_lease_is_given_up_after_max_attempts(self):
+        for _ in range(2):
+            self.work_queue.lease("dead-worker", 10)
+            time.sleep(0.1)
+        self.assertEqual(self.work_queue.counts(), { "failed": 2 })
+        self.assertEqual(self.work_queue.lease("live-worker", 10), [])
+
+    def test_release_and_fail(self):
+        self.work_queue.lease("worker", 10)
+        self.work_queue.complete("alpha", "worker", [ { "Real Account": "alpha" } ])
+        self.work_queue.release([ "beta" ], "worker")
+        self.assertEqual(self.work_queue.counts(), { "done": 1, "pending": 1 })
+
+        self.assertEqual(self.work_queue.lease("worker", 10), [ "beta" ])
+        self.work_queue.fail([ "beta" ], "worker")
+        self.assertEqual(self.work_queue.counts(), { "done": 1, "failed": 1 })
+        self.assertEqual(list(self.work_queue.results()), [ { "Real Account": "alpha" } ])
+
+    def test_report_of_worker_that_lost_lease_is_ignored(self):
+        self.work_queue.lease("slow-worker", 10)
+        time.sleep(0.1)
+        self.work_queue.lease("live-worker", 10)
+        self.work_queue.complete("alpha", "slow-worker", [ { "Real Account": "alpha" } ])
+        self.assertEqual(self.work_queue.counts(), { "leased": 2 })
+
+
+if __name__ == "__main__":
+    unittest.main()